@@ -0,0 +1,94 @@
+# !/usr/bin/python
+# -*- coding:utf-8 -*-
+"""
+textCombing.process_text 基准测试:对比旧实现(每行重新读取 character.json、字符串 += 拼接)
+与当前实现(配置按修改时间缓存、分隔符 frozenset、列表缓冲拼接)
+
+运行: python tests/bench_textManager.py [行数]
+"""
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wei_office_simptool.textManager import textCombing
+
+
+def legacy_process_text(text):
+    """改动前的 process_text,仅用于对比"""
+    processed_text = re.sub(r'\n+', '\n', text)
+    processed_text = re.sub(r'^(\d+)(\、|\.|\ 、|\；)?', r'\1、', processed_text, flags=re.MULTILINE)
+    processed_text = re.sub(r'^\d+(\、|\.|\ 、)？(\s?)', r'1 \2', processed_text)
+    processed_text = re.sub(r'\u200B', '', processed_text)
+
+    adjusted_text = ""
+    adjusted_num = 0
+    for line in processed_text.splitlines():
+        if line.strip() != "":
+            if line.strip()[0].isdigit():
+                adjusted_text += "\n"
+                adjusted_num = 0
+            else:
+                if adjusted_num == -1 and not line.strip()[0].isdigit():
+                    adjusted_text += '1、'
+            adjusted_num += len(line)
+            adjusted_text += line
+            try:
+                with open('./character.json', 'r', encoding='utf-8') as file:
+                    data = json.load(file)
+                    if adjusted_text and (
+                            not (adjusted_text[-1] in data['separator']) and not (
+                            line[0] in data['separator'])):
+                        adjusted_text += "，"
+            except:
+                pass
+            if adjusted_num >= 200:
+                adjusted_num = -1
+                adjusted_text = adjusted_text[:-1] + "。"
+                adjusted_text += "\n"
+    adjusted_text = adjusted_text.strip()[:-1] + "。"
+    return adjusted_text.strip()
+
+
+def make_document(n_lines):
+    lines = []
+    for i in range(n_lines):
+        if i % 7 == 0:
+            lines.append(f"{i % 30 + 1}、第{i}条 要点说明")
+        elif i % 5 == 0:
+            lines.append(f"补充说明内容 {i}。")
+        else:
+            lines.append(f"这是第{i}行正文内容，用于测试文本整理的速度")
+    return "\n".join(lines)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main(n_lines=50000):
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            with open('character.json', 'w', encoding='utf-8') as f:
+                json.dump({'separator': ['。', '，', '；', '：', '！', '？', ',', '.']}, f, ensure_ascii=False)
+            text = make_document(n_lines)
+
+            old_result, old_time = timed(legacy_process_text, text)
+            new_result, new_time = timed(textCombing().process_text, text)
+        finally:
+            os.chdir(cwd)
+
+    assert old_result == new_result, "新旧实现结果不一致"
+    print(f"{n_lines} 行: 旧实现 {old_time:.3f}s, 新实现 {new_time:.3f}s, 提速 {old_time / new_time:.1f} 倍")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
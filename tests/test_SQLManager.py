@@ -0,0 +1,97 @@
+# !/usr/bin/python
+# -*- coding:utf-8 -*-
+import unittest
+from unittest import mock
+
+import mysql.connector
+
+from wei_office_simptool.SQLManager import MySQLDatabase, _estimate_bytes
+
+
+class _FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.rowcount = len(rows)
+
+    def execute(self, query, params=None):
+        pass
+
+    def fetchall(self):
+        return self.rows
+
+    def executemany(self, query, params):
+        self.params = params
+
+    def close(self):
+        pass
+
+
+class _BrokenCursor(_FakeCursor):
+    def executemany(self, query, params):
+        raise mysql.connector.OperationalError(msg="Lost connection", errno=2013)
+
+
+class _FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def cursor(self, dictionary=False, **kwargs):
+        return _FakeCursor(self.rows)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class _BrokenConnection(_FakeConnection):
+    def cursor(self, dictionary=False, **kwargs):
+        return _BrokenCursor(self.rows)
+
+
+class TestEstimateBytes(unittest.TestCase):
+    def test_sampled_sizes(self):
+        # 超过抽样行数的各种行数都能直接估算,结果与逐行计数一致(每行相同)
+        for n_rows in (101, 150, 199, 250, 1050, 10099):
+            rows = [("abcd", 1, None)] * n_rows
+            self.assertEqual(_estimate_bytes(rows), 12 * n_rows)
+
+    def test_small_results_counted_exactly(self):
+        self.assertEqual(_estimate_bytes([("ab", 1), {"a": "xyz", "b": None}]), 2 + 8 + 3)
+
+    def test_fetch_query_records_bytes(self):
+        for n_rows in (101, 150, 250):
+            with mock.patch.object(mysql.connector, "connect", return_value=_FakeConnection([("x",)] * n_rows)):
+                db = MySQLDatabase({})
+            self.assertEqual(len(db.fetch_query("select 1")), n_rows)
+            self.assertEqual(db.stats()[0]["bytes"], n_rows)
+
+
+class TestExecuteManyResumable(unittest.TestCase):
+    def test_retries_through_failed_reconnect(self):
+        # 首次写入断线,第一次重连仍失败,之后恢复:应继续退避重试直到写入成功
+        outage = mysql.connector.InterfaceError(msg="Can't connect to MySQL server", errno=2003)
+        connect = mock.Mock(side_effect=[_BrokenConnection([]), outage, _FakeConnection([])])
+        with mock.patch.object(mysql.connector, "connect", connect), mock.patch("time.sleep"):
+            db = MySQLDatabase({})
+            result = db.execute_many_resumable("insert into t values (%s)", [(1,), (2,)], backoff=0)
+        self.assertEqual(result['committed'], 2)
+        self.assertEqual(result['retries'], 2)
+        self.assertEqual(connect.call_count, 3)
+
+    def test_gives_up_when_reconnect_keeps_failing(self):
+        outage = mysql.connector.InterfaceError(msg="Can't connect to MySQL server", errno=2003)
+        connect = mock.Mock(side_effect=[_BrokenConnection([])] + [outage] * 3)
+        with mock.patch.object(mysql.connector, "connect", connect), mock.patch("time.sleep"):
+            db = MySQLDatabase({})
+            with self.assertRaises(mysql.connector.InterfaceError):
+                db.execute_many_resumable("insert into t values (%s)", [(1,)], max_retries=3, backoff=0)
+        self.assertEqual(connect.call_count, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -27,10 +27,22 @@
 @email:thisluckyboy@126.com
 """
 import mysql.connector
-from collections import deque
+import hashlib
+import json
+import logging
+import math
+import os
+import queue
+import random
+import re
+import time
+from bisect import bisect_left
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+from time import perf_counter
 # import openpyxl
-# import pandas as pd
-from .timingTool import fn_timer
+import pandas as pd
 from typing import List, Optional, Union, Any
 # import pymysql
 
@@ -174,26 +186,305 @@ from typing import List, Optional, Union, Any
 # db('SELECT * FROM users', operation_mode='r')
 # db('INSERT INTO users (name, age) VALUES (%s, %s)', params=[('Alice', 30), ('Bob', 25)], operation_mode='m')
 
+_FP_STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"")
+_FP_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_FP_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|\?")
+_FP_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_FP_SPACE = re.compile(r"\s+")
+_EXPLAINABLE = ('select', 'insert', 'update', 'delete', 'replace', 'with')
+# 可重试的错误码:锁等待超时、死锁、连接断开/丢失
+_TRANSIENT_ERRNOS = {1205, 1213, 2003, 2006, 2013, 2055}
+
+
+def _is_transient_error(err):
+    """判断是否为换一个连接重试即可恢复的临时错误"""
+    if isinstance(err, (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError)):
+        return True
+    return getattr(err, 'errno', None) in _TRANSIENT_ERRNOS
+
+
+@lru_cache(maxsize=1024)
+def sql_fingerprint(query):
+    """
+    生成 SQL 指纹:去掉字面量和占位符差异,用于把同一类查询归并统计
+    例如 "SELECT * FROM t WHERE id IN (1, 2, 3)" -> "select * from t where id in (?+)"
+    """
+    if isinstance(query, (bytes, bytearray)):
+        query = query.decode('utf-8', 'replace')
+    text = _FP_STRING.sub('?', query)
+    text = _FP_NUMBER.sub('?', text)
+    text = _FP_PLACEHOLDER.sub('?', text)
+    text = _FP_IN_LIST.sub('(?+)', text)
+    return _FP_SPACE.sub(' ', text).strip().lower()
+
+
+_BYTES_SAMPLE_ROWS = 100
+
+
+def _estimate_bytes(rows):
+    """
+    粗略估算结果集/参数的数据量:字符串按长度计,其他非空值按 8 字节计。
+    行数较多时只均匀抽取约 100 行估算再按行数放大,避免在每次查询的热路径上遍历全部单元格
+    """
+    n_rows = len(rows) if isinstance(rows, (list, tuple)) else 0
+    if n_rows > _BYTES_SAMPLE_ROWS:
+        # 向上取整保证样本不超过 100 行
+        sample = rows[::math.ceil(n_rows / _BYTES_SAMPLE_ROWS)]
+        return int(_count_bytes(sample) * n_rows / len(sample))
+    return _count_bytes(rows)
+
+
+def _count_bytes(rows):
+    total = 0
+    for row in rows:
+        values = row.values() if isinstance(row, dict) else row
+        for value in values:
+            if isinstance(value, (str, bytes, bytearray)):
+                total += len(value)
+            elif value is not None:
+                total += 8
+    return total
+
+
+def _params_rows(params):
+    """把单条/多条查询参数统一成行列表,便于估算数据量"""
+    if not params:
+        return []
+    if isinstance(params, list):
+        return params
+    if isinstance(params, (tuple, dict)):
+        return [params]
+    return [(params,)]
+
+
+class LoggingQueryHook:
+    """把每次查询的执行记录写入 logging"""
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger(__name__)
+        self.level = level
+
+    def __call__(self, record):
+        self.logger.log(
+            self.level,
+            "sql %s %.2fms rows=%s bytes=%s fp=%s%s",
+            record['operation'], record['latency'] * 1000, record['rows'], record['bytes'],
+            record['digest'], f" error={record['error']}" if record['error'] else '',
+        )
+
+
+class HistogramQueryHook:
+    """按 SQL 指纹统计耗时分布的内存直方图"""
+    def __init__(self, buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)):
+        """
+        :param buckets: 桶上界(秒),超过最后一个上界的记录落入 "+Inf" 桶
+        """
+        self.buckets = tuple(sorted(buckets))
+        self.histograms = {}
+
+    def __call__(self, record):
+        counts = self.histograms.setdefault(record['fingerprint'], [0] * (len(self.buckets) + 1))
+        counts[bisect_left(self.buckets, record['latency'])] += 1
+
+    def snapshot(self):
+        """
+        :return: {SQL指纹: {桶上界: 次数}}
+        """
+        labels = [f"<={b}s" for b in self.buckets] + ["+Inf"]
+        return {fp: dict(zip(labels, counts)) for fp, counts in self.histograms.items()}
+
+
 class MySQLDatabase:
-    def __init__(self, config):
+    def __init__(self, config, stmt_cache_size=64, hooks=None, slow_query_threshold=None,
+                 slow_query_log_size=100):
+        """
+        :param config: mysql.connector.connect 的连接参数
+        :param stmt_cache_size: 预处理语句缓存的最大条数(按 SQL 文本 LRU 淘汰),0 表示不缓存
+        :param hooks: 查询钩子列表,每次执行后以执行记录(dict)调用,如 LoggingQueryHook、HistogramQueryHook 或任意回调函数
+        :param slow_query_threshold: 慢查询阈值(秒),超过时抓取 EXPLAIN 执行计划,None 表示不记录慢查询
+        :param slow_query_log_size: 保留的慢查询记录条数
+        """
         self.config = config
         self.connection = None
+        self.stmt_cache_size = stmt_cache_size
+        self._stmt_cache = OrderedDict()
+        self._stmt_cache_hits = 0
+        self._stmt_cache_misses = 0
+        self.hooks = list(hooks) if hooks else []
+        self.slow_query_threshold = slow_query_threshold
+        self.slow_queries = deque(maxlen=slow_query_log_size)
+        self._query_stats = {}
         self.connect()
 
     def connect(self):
+        # 预处理语句句柄绑定在连接上,重连后需要重新准备
+        self.clear_stmt_cache()
         try:
             self.connection = mysql.connector.connect(**self.config)
             print("Connected to MySQL database")
         except mysql.connector.Error as err:
             print(f"Error: {err}")
 
+    def _reconnect(self):
+        """
+        关闭已断开的旧连接(忽略错误)后重新连接,避免每次重试泄漏一个连接。
+        与 connect 不同,连接失败时直接抛出 mysql.connector.Error,交由重试逻辑按临时错误处理
+        """
+        self.clear_stmt_cache()
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+            self.connection = None
+        self.connection = mysql.connector.connect(**self.config)
+
     def close(self):
+        self.clear_stmt_cache()
         if self.connection:
             self.connection.close()
             print("MySQL connection closed")
 
-    def execute_query(self, query, params=None):
+    def _get_prepared_cursor(self, query, dictionary=False):
+        """
+        从 LRU 缓存中取出 SQL 对应的预处理游标,不存在则新建
+        :return: (缓存中的 SQL 文本对象, 预处理游标)
+        """
+        key = (query, dictionary)
+        entry = self._stmt_cache.get(key)
+        if entry is not None:
+            self._stmt_cache.move_to_end(key)
+            self._stmt_cache_hits += 1
+            return entry
+        self._stmt_cache_misses += 1
+        cursor = self.connection.cursor(prepared=True, dictionary=dictionary)
+        # 游标只在收到同一个 SQL 字符串对象时复用已准备的语句,因此缓存原始对象
+        entry = (query, cursor)
+        self._stmt_cache[key] = entry
+        while len(self._stmt_cache) > self.stmt_cache_size:
+            _, (_, old_cursor) = self._stmt_cache.popitem(last=False)
+            self._close_cursor(old_cursor)
+        return entry
+
+    def _discard_prepared(self, query, dictionary=False):
+        """出错后丢弃对应的预处理游标,避免复用处于异常状态的语句"""
+        entry = self._stmt_cache.pop((query, dictionary), None)
+        if entry is not None:
+            self._close_cursor(entry[1])
+
+    @staticmethod
+    def _close_cursor(cursor):
+        try:
+            cursor.close()
+        except mysql.connector.Error:
+            pass
+
+    def clear_stmt_cache(self):
+        """关闭并清空所有缓存的预处理语句"""
+        while self._stmt_cache:
+            _, (_, cursor) = self._stmt_cache.popitem(last=False)
+            self._close_cursor(cursor)
+
+    def stmt_cache_stats(self):
+        """
+        预处理语句缓存统计
+        :return: 包含 hits/misses/size/capacity 的字典
+        """
+        return {
+            'hits': self._stmt_cache_hits,
+            'misses': self._stmt_cache_misses,
+            'size': len(self._stmt_cache),
+            'capacity': self.stmt_cache_size,
+        }
+
+    def add_hook(self, hook):
+        """添加查询钩子,hook(record) 会在每次执行后被调用"""
+        self.hooks.append(hook)
+
+    def _record(self, operation, query, params, elapsed, rows=None, nbytes=0, error=None):
+        """记录一次执行:更新统计、抓取慢查询执行计划并调用钩子"""
+        fingerprint = sql_fingerprint(query)
+        record = {
+            'operation': operation,
+            'sql': query,
+            'fingerprint': fingerprint,
+            'digest': hashlib.md5(fingerprint.encode('utf-8')).hexdigest()[:12],
+            'latency': elapsed,
+            'rows': rows,
+            'bytes': nbytes,
+            'error': str(error) if error else None,
+        }
+
+        stat = self._query_stats.get(fingerprint)
+        if stat is None:
+            stat = self._query_stats[fingerprint] = {
+                'fingerprint': fingerprint, 'digest': record['digest'], 'count': 0, 'errors': 0,
+                'total_time': 0.0, 'max_time': 0.0, 'rows': 0, 'bytes': 0, 'slow': 0,
+            }
+        stat['count'] += 1
+        stat['total_time'] += elapsed
+        stat['max_time'] = max(stat['max_time'], elapsed)
+        stat['rows'] += rows or 0
+        stat['bytes'] += nbytes
+        if error:
+            stat['errors'] += 1
+
+        if (self.slow_query_threshold is not None and not error
+                and elapsed >= self.slow_query_threshold):
+            stat['slow'] += 1
+            if operation != 'procedure':
+                record['explain'] = self._explain(query, params)
+            self.slow_queries.append(record)
+
+        for hook in self.hooks:
+            try:
+                hook(record)
+            except Exception as err:
+                print(f"查询钩子错误: {err}")
+
+    def _explain(self, query, params=None):
+        """抓取慢查询的执行计划,失败时返回 None"""
+        if isinstance(query, (bytes, bytearray)):
+            query = query.decode('utf-8', 'replace')
+        if query.lstrip().split(None, 1)[0].lower() not in _EXPLAINABLE:
+            return None
+        if isinstance(params, list):
+            params = params[0] if params else None
+        cursor = self.connection.cursor(dictionary=True)
+        try:
+            if params:
+                cursor.execute(f"EXPLAIN {query}", params)
+            else:
+                cursor.execute(f"EXPLAIN {query}")
+            return cursor.fetchall()
+        except mysql.connector.Error:
+            return None
+        finally:
+            cursor.close()
+
+    def stats(self, top=None):
+        """
+        按 SQL 指纹汇总的执行统计,按总耗时从高到低排序
+        :param top: 只返回前 N 条,None 返回全部
+        :return: 统计字典列表,包含 count/errors/total_time/avg_time/max_time/rows/bytes/slow
+        """
+        summary = []
+        for stat in self._query_stats.values():
+            item = dict(stat)
+            item['avg_time'] = stat['total_time'] / stat['count'] if stat['count'] else 0.0
+            summary.append(item)
+        summary.sort(key=lambda item: item['total_time'], reverse=True)
+        return summary[:top] if top else summary
+
+    def reset_stats(self):
+        self._query_stats.clear()
+        self.slow_queries.clear()
+
+    def execute_query(self, query, params=None, prepared=False):
+        if prepared and self.stmt_cache_size > 0:
+            return self._execute_prepared(query, params)
         cursor = self.connection.cursor()
+        error = None
+        t0 = perf_counter()
         try:
             if params:
                 if isinstance(params, list):
@@ -205,23 +496,158 @@ class MySQLDatabase:
             self.connection.commit()
             print("Query executed successfully")
         except mysql.connector.Error as err:
+            error = err
             print(f"Error: {err}")
         finally:
+            rows = cursor.rowcount
             cursor.close()
+            self._record('execute', query, params, perf_counter() - t0, rows,
+                         _estimate_bytes(_params_rows(params)), error)
 
     def execute_many(self, query, params_list):
         cursor = self.connection.cursor()
+        error = None
+        t0 = perf_counter()
         try:
             cursor.executemany(query, params_list)
             self.connection.commit()
             print("Batch query executed successfully")
         except mysql.connector.Error as err:
+            error = err
             print(f"Error: {err}")
         finally:
+            rows = cursor.rowcount
             cursor.close()
+            self._record('execute', query, params_list, perf_counter() - t0, rows,
+                         _estimate_bytes(params_list or []), error)
+
+    def execute_many_resumable(self, query, params_list, batch_size=1000, checkpoint_file=None,
+                               max_retries=5, backoff=1.0, max_backoff=60.0):
+        """
+        可断点续传的批量写入:按批提交,每批提交后把已提交的偏移量写入本地检查点文件,
+        遇到连接断开、死锁等临时错误时指数退避并换新连接重试当前批次。
+        任务中断后用相同参数重新调用,会从检查点记录的位置继续。
+        注意:若提交成功但确认包丢失,重试会重复写入该批,需要精确一次时请配合唯一键使用 INSERT IGNORE/ON DUPLICATE KEY UPDATE
+        :param query: 写入语句
+        :param params_list: 参数列表(需支持切片)
+        :param batch_size: 每批提交的行数
+        :param checkpoint_file: 检查点文件路径,None 表示不记录检查点
+        :param max_retries: 单个批次的最大重试次数
+        :param backoff: 首次重试的等待秒数,之后每次翻倍
+        :param max_backoff: 单次等待的最大秒数
+        :return: {'committed': 已提交行数, 'resumed_from': 起始偏移量, 'batches': 本次提交批数, 'retries': 重试次数}
+        :raises mysql.connector.Error: 非临时错误或重试次数用尽时抛出,检查点保留以便续传
+        """
+        if batch_size <= 0:
+            raise ValueError("batch_size 必须大于 0")
+        total = len(params_list)
+        job = {'fingerprint': sql_fingerprint(query), 'total': total}
+        offset = self._load_checkpoint(checkpoint_file, job)
+        if offset:
+            print(f"从检查点继续写入: {offset}/{total}")
+        resumed_from = offset
+        batches = 0
+        retries = 0
+
+        while offset < total:
+            batch = params_list[offset:offset + batch_size]
+            attempt = 0
+            reconnect = False
+            while True:
+                cursor = None
+                error = None
+                t0 = perf_counter()
+                try:
+                    # 重连放在 try 内:数据库仍不可用时连接错误同样按临时错误退避重试
+                    if reconnect or self.connection is None:
+                        self._reconnect()
+                        reconnect = False
+                    cursor = self.connection.cursor()
+                    cursor.executemany(query, batch)
+                    self.connection.commit()
+                    break
+                except mysql.connector.Error as err:
+                    error = err
+                    if self.connection is not None:
+                        try:
+                            self.connection.rollback()
+                        except mysql.connector.Error:
+                            pass
+                    if not _is_transient_error(err) or attempt >= max_retries:
+                        print(f"Error: {err}")
+                        raise
+                    delay = min(backoff * (2 ** attempt), max_backoff) * (0.5 + random.random() / 2)
+                    attempt += 1
+                    retries += 1
+                    print(f"批量写入出错,{delay:.1f} 秒后第 {attempt} 次重试: {err}")
+                    time.sleep(delay)
+                    reconnect = True
+                finally:
+                    if cursor is not None:
+                        self._close_cursor(cursor)
+                    self._record('execute', query, batch, perf_counter() - t0,
+                                 len(batch) if error is None else 0, _estimate_bytes(batch), error)
 
-    def fetch_query(self, query, params=None,dictionary=False):
+            offset += len(batch)
+            batches += 1
+            self._save_checkpoint(checkpoint_file, job, offset)
+
+        if checkpoint_file and os.path.exists(checkpoint_file):
+            os.remove(checkpoint_file)
+        print("Batch query executed successfully")
+        return {'committed': offset, 'resumed_from': resumed_from, 'batches': batches, 'retries': retries}
+
+    @staticmethod
+    def _load_checkpoint(checkpoint_file, job):
+        """读取检查点,只有 SQL 指纹和总行数都一致时才续传"""
+        if not checkpoint_file or not os.path.exists(checkpoint_file):
+            return 0
+        try:
+            with open(checkpoint_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        if data.get('fingerprint') != job['fingerprint'] or data.get('total') != job['total']:
+            print(f"检查点与当前任务不匹配,从头开始: {checkpoint_file}")
+            return 0
+        return int(data.get('offset', 0))
+
+    @staticmethod
+    def _save_checkpoint(checkpoint_file, job, offset):
+        """先写临时文件再替换,避免中断时留下损坏的检查点"""
+        if not checkpoint_file:
+            return
+        tmp_file = f"{checkpoint_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(dict(job, offset=offset), f)
+        os.replace(tmp_file, checkpoint_file)
+
+    def _execute_prepared(self, query, params=None):
+        query, cursor = self._get_prepared_cursor(query)
+        error = None
+        t0 = perf_counter()
+        try:
+            if isinstance(params, list):
+                cursor.executemany(query, params)
+            else:
+                cursor.execute(query, params or ())
+            self.connection.commit()
+            print("Query executed successfully")
+        except mysql.connector.Error as err:
+            error = err
+            print(f"Error: {err}")
+            self._discard_prepared(query)
+        finally:
+            self._record('execute', query, params, perf_counter() - t0, cursor.rowcount,
+                         _estimate_bytes(_params_rows(params)), error)
+
+    def fetch_query(self, query, params=None,dictionary=False, prepared=False):
+        if prepared and self.stmt_cache_size > 0:
+            return self._fetch_prepared(query, params, dictionary)
         cursor = self.connection.cursor(dictionary=dictionary)
+        result = None
+        error = None
+        t0 = perf_counter()
         try:
             if params:
                 cursor.execute(query, params)
@@ -230,10 +656,100 @@ class MySQLDatabase:
             result = cursor.fetchall()
             return result
         except mysql.connector.Error as err:
+            error = err
             print(f"Error: {err}")
         finally:
-            cursor.close()            
-            
+            cursor.close()
+            self._record('fetch', query, params, perf_counter() - t0,
+                         len(result) if result is not None else 0,
+                         _estimate_bytes(result or []), error)
+
+    def _fetch_prepared(self, query, params=None, dictionary=False):
+        query, cursor = self._get_prepared_cursor(query, dictionary)
+        result = None
+        error = None
+        t0 = perf_counter()
+        try:
+            cursor.execute(query, params or ())
+            result = cursor.fetchall()
+            return result
+        except mysql.connector.Error as err:
+            error = err
+            print(f"Error: {err}")
+            self._discard_prepared(query, dictionary)
+        finally:
+            self._record('fetch', query, params, perf_counter() - t0,
+                         len(result) if result is not None else 0,
+                         _estimate_bytes(result or []), error)
+
+    def fetch_in(self, query, values, chunk_size=1000, params=None, dictionary=False, prepared=False):
+        """
+        大量键值的 IN 查询:去重后按 chunk_size 分批,把查询中的 {} 替换为 (%s,...,%s) 参数化执行并合并结果
+        例: db.fetch_in("SELECT * FROM orders WHERE order_no IN {}", order_nos)
+        :param params: 放在 IN 参数之前的其他参数
+        :return: 所有批次结果合并后的列表,任一批次出错时返回 None
+        """
+        values = list(dict.fromkeys(values))
+        prefix = tuple(params or ())
+        queries = {}
+        results = []
+        for start in range(0, len(values), chunk_size):
+            chunk = values[start:start + chunk_size]
+            # 相同长度的批次复用同一条 SQL,便于预处理语句缓存命中
+            sql = queries.get(len(chunk))
+            if sql is None:
+                sql = queries[len(chunk)] = query.replace('{}', '(' + ','.join(['%s'] * len(chunk)) + ')', 1)
+            rows = self.fetch_query(sql, prefix + tuple(chunk), dictionary=dictionary, prepared=prepared)
+            if rows is None:
+                return None
+            results.extend(rows)
+        return results
+
+    def stream_query(self, query, params=None, batch_size=1000):
+        """
+        使用服务端(非缓冲)游标流式读取查询结果,结果集不会一次性加载到内存
+        :param query: 查询语句
+        :param params: 查询参数
+        :param batch_size: 每批读取的行数
+        :return: (列名元组, 按批产出行列表的生成器)
+        :raises mysql.connector.Error: 查询执行失败时抛出,避免导出被静默截断
+        """
+        cursor = self.connection.cursor(buffered=False)
+        t0 = perf_counter()
+        try:
+            if params:
+                cursor.execute(query, params)
+            else:
+                cursor.execute(query)
+        except mysql.connector.Error as err:
+            print(f"Error: {err}")
+            cursor.close()
+            self._record('stream', query, params, perf_counter() - t0, 0, 0, err)
+            raise
+        columns = tuple(cursor.column_names or ())
+
+        def batches():
+            # 耗时统计到结果集读取完毕(或提前关闭)为止
+            rows_read = 0
+            nbytes = 0
+            error = None
+            try:
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    rows_read += len(rows)
+                    nbytes += _estimate_bytes(rows)
+                    yield rows
+            except mysql.connector.Error as err:
+                error = err
+                raise
+            finally:
+                cursor.close()
+                self._record('stream', query, params, perf_counter() - t0, rows_read, nbytes, error)
+
+        return columns, batches()
+
     def call_procedure(self, proc_name, params=None):
         """
         调用存储过程的方法
@@ -242,6 +758,9 @@ class MySQLDatabase:
         :return: 如果存储过程有返回结果则返回结果集,否则返回None
         """
         cursor = self.connection.cursor(dictionary=True)
+        results = []
+        error = None
+        t0 = perf_counter()
         try:
             if params:
                 cursor.callproc(proc_name, params if isinstance(params, (list, tuple)) else (params,))
@@ -249,7 +768,6 @@ class MySQLDatabase:
                 cursor.callproc(proc_name)
             
             # 获取存储过程的所有结果集
-            results = []
             for result in cursor.stored_results():
                 results.extend(result.fetchall())
                 
@@ -257,11 +775,64 @@ class MySQLDatabase:
             return results if results else None
             
         except mysql.connector.Error as err:
+            error = err
             print(f"存储过程调用错误: {err}")
             self.connection.rollback()
             return None
         finally:
             cursor.close()
+            self._record('procedure', f"CALL {proc_name}", params, perf_counter() - t0,
+                         len(results), _estimate_bytes(results), error)
+
+    def call_procedures_batch(self, calls, as_dataframe=False):
+        """
+        批量调用存储过程:复用同一个游标,所有调用在一个事务中执行,最后统一提交
+        :param calls: [(存储过程名称, 参数), ...],参数可以是单个值、元组或 None
+        :param as_dataframe: True 时每个结果集返回 DataFrame,否则返回按列组织的字典 {列名: [值, ...]}
+        :return: 与 calls 一一对应的列表,每个元素是该次调用的结果集列表;出错时回滚并返回 None
+        """
+        cursor = self.connection.cursor()
+        outputs = []
+        try:
+            for proc_name, params in calls:
+                result_sets = []
+                rows = 0
+                nbytes = 0
+                error = None
+                t0 = perf_counter()
+                try:
+                    if params:
+                        cursor.callproc(proc_name, params if isinstance(params, (list, tuple)) else (params,))
+                    else:
+                        cursor.callproc(proc_name)
+                    for result in cursor.stored_results():
+                        columns = list(result.column_names)
+                        data = result.fetchall()
+                        rows += len(data)
+                        nbytes += _estimate_bytes(data)
+                        if as_dataframe:
+                            result_sets.append(pd.DataFrame.from_records(data, columns=columns))
+                        else:
+                            # 按列转置,避免逐行构造字典
+                            values = list(zip(*data)) if data else [()] * len(columns)
+                            result_sets.append({col: list(vals) for col, vals in zip(columns, values)})
+                except mysql.connector.Error as err:
+                    error = err
+                    raise
+                finally:
+                    self._record('procedure', f"CALL {proc_name}", params, perf_counter() - t0,
+                                 rows, nbytes, error)
+                outputs.append(result_sets)
+
+            self.connection.commit()
+            return outputs
+
+        except mysql.connector.Error as err:
+            print(f"存储过程调用错误({proc_name}): {err}")
+            self.connection.rollback()
+            return None
+        finally:
+            cursor.close()
 
     def run_ai_chatbot(self, chat_history_size=5, system_msg="System: You are a helpful AI assistant."):
         try:
@@ -286,6 +857,46 @@ class MySQLDatabase:
             chat_history.append(f"User: {user_input}")
             chat_history.append(f"Bot: {response}")
 
+class MySQLDatabasePool:
+    """
+    MySQLDatabase 连接池,用于多线程并发查询,每个线程借用一个独立连接
+    """
+    def __init__(self, config, size=4, **db_kwargs):
+        """
+        :param config: mysql.connector.connect 的连接参数
+        :param size: 连接数量
+        :param db_kwargs: 传给 MySQLDatabase 的其他参数(如 stmt_cache_size)
+        """
+        if size <= 0:
+            raise ValueError("size 必须大于 0")
+        self.size = size
+        self._databases = [MySQLDatabase(config, **db_kwargs) for _ in range(size)]
+        self._idle = queue.Queue()
+        for db in self._databases:
+            self._idle.put(db)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """
+        借用一个连接,退出上下文时归还
+        :param timeout: 等待空闲连接的超时时间(秒),None 表示一直等待
+        """
+        db = self._idle.get(timeout=timeout)
+        try:
+            yield db
+        finally:
+            self._idle.put(db)
+
+    def close(self):
+        for db in self._databases:
+            db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
 # from wei_office_simptool import SQLManager
 # cfg = {
 #     'user': 'root',
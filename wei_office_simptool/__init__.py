@@ -38,7 +38,7 @@ from .excelManager import *
 from .fileManager import *
 from .mailManager import *
 from .stringManager import *
-from .chartsManager import TrendPredictor,MultipleTrendPredictor,TextAnalysis
+from .chartsManager import TrendPredictor,MultipleTrendPredictor,PanelTrendPredictor,TextAnalysis,TokenCache
 from .textManager import *
 from .ollamaManager import *
 
@@ -7,12 +7,269 @@ import pandas as pd
 from matplotlib import pyplot as plt
 from wordcloud import WordCloud
 from statsmodels.tsa.stattools import adfuller
+from statsmodels.tools.sm_exceptions import ConvergenceWarning
+from scipy import sparse
+from threadpoolctl import threadpool_limits
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from functools import lru_cache, partial
+import csv
+import hashlib
+import heapq
+import json
+import math
+import os
+import pickle
+import sqlite3
+import time
 import warnings
+from openpyxl import Workbook, load_workbook
+from .excelManager import EXCEL_MAX_ROWS, _rollover_sheet_title
+
+_BLAS_THREAD_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                     'VECLIB_MAXIMUM_FRAMEWORK_THREADS', 'NUMEXPR_NUM_THREADS')
+
+
+def _limit_blas_threads(n_threads=1):
+    """
+    进程池初始化:限制每个工作进程的 BLAS 线程数,避免多进程下线程数超卖。
+    Linux 下工作进程由 fork 创建,BLAS 已在父进程中加载,环境变量不再生效,需通过 threadpoolctl 在运行时调整;
+    环境变量仍然设置,供工作进程再启动的子进程使用
+    """
+    for var in _BLAS_THREAD_VARS:
+        os.environ[var] = str(n_threads)
+    threadpool_limits(limits=n_threads)
+
+
+def _resolve_n_jobs(n_jobs):
+    """n_jobs 为 None/-1 时使用全部 CPU"""
+    if n_jobs is None or n_jobs < 0:
+        return os.cpu_count() or 1
+    return max(1, n_jobs)
+
+
+def _process_pool(n_jobs, blas_threads=1):
+    return ProcessPoolExecutor(max_workers=n_jobs, initializer=_limit_blas_threads,
+                               initargs=(blas_threads,))
+
+
+def _terminate_pool(executor):
+    """
+    取消排队任务并强制结束工作进程。
+    shutdown(wait=False) 不会中断正在运行的拟合,残留进程会继续占用 CPU 并阻塞解释器退出
+    """
+    # _processes 是私有属性,shutdown 之后会被置空,需要提前取出
+    processes = list((getattr(executor, '_processes', None) or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        try:
+            process.terminate()
+            process.join(timeout=1)
+        except Exception:
+            pass
+
+
+def _fit_forecast_chunk(chunk, order, steps):
+    """
+    在工作进程中逐列拟合 ARIMA 并预测
+    :param chunk: [(列名, 数值数组), ...]
+    :return: [(列名, 预测值数组或 None, 错误信息或 None), ...]
+    """
+    results = []
+    for name, values in chunk:
+        try:
+            model_fit = ARIMA(values, order=order).fit()
+            results.append((name, np.asarray(model_fit.forecast(steps=steps)), None))
+        except Exception as e:
+            results.append((name, None, f"{type(e).__name__}: {e}"))
+    return results
+
+# 自动定阶结果缓存:{(序列指纹, max_p, max_q, 准则): 阶数}
+_ORDER_CACHE = {}
+
+
+def _series_fingerprint(values):
+    """序列内容的指纹,用于缓存"""
+    data = np.ascontiguousarray(np.asarray(values, dtype=float))
+    return hashlib.sha1(data.tobytes()).hexdigest()
+
+
+def _evaluate_order(values, order):
+    """
+    拟合单个候选阶数,未收敛或拟合失败的候选返回 None 以便剪枝
+    :return: (阶数, AIC, BIC) 或 (阶数, None, 原因)
+    """
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always', ConvergenceWarning)
+        try:
+            model_fit = ARIMA(values, order=order).fit()
+        except Exception as e:
+            return order, None, f"{type(e).__name__}: {e}"
+    if any(issubclass(w.category, ConvergenceWarning) for w in caught):
+        return order, None, '未收敛'
+    if not np.isfinite(model_fit.aic):
+        return order, None, 'AIC 无效'
+    return order, model_fit.aic, model_fit.bic
+
+
+ENGINES = ('arima', 'ewma', 'holt', 'seasonal_naive', 'auto')
+FAST_ENGINES = ('ewma', 'holt', 'seasonal_naive')
+_SMOOTHING_ALPHAS = (0.1, 0.3, 0.5, 0.7, 0.9)
+_SMOOTHING_BETAS = (0.05, 0.1, 0.2, 0.4)
+
+
+def _initial_level(Y):
+    """第一行作为初始水平,缺失时用列均值代替"""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.where(np.isnan(Y[0]), np.nan_to_num(np.nanmean(Y, axis=0)), Y[0])
+
+
+def _smooth(Y, alpha, beta=None):
+    """
+    按列同时运行指数平滑(beta 为 None)或 Holt 线性趋势平滑,缺失值用一步预测值代替
+    :return: (最终水平, 最终趋势, 一步预测误差平方和, 有效误差个数)
+    """
+    level = _initial_level(Y)
+    trend = np.zeros(Y.shape[1])
+    if beta is not None and len(Y) > 1:
+        trend = np.nan_to_num(Y[1] - Y[0])
+    sse = np.zeros(Y.shape[1])
+    count = np.zeros(Y.shape[1])
+    for t in range(1, len(Y)):
+        prediction = level + trend
+        observed = ~np.isnan(Y[t])
+        error = np.where(observed, Y[t] - prediction, 0.0)
+        sse += error ** 2
+        count += observed
+        level = prediction + alpha * error
+        if beta is not None:
+            trend = trend + alpha * beta * error
+    return level, trend, sse, count
+
+
+def _fast_forecast(engine, Y, steps, season_length=7):
+    """
+    NumPy 向量化的快速预测,所有列一次计算,平滑参数按列从网格中选一步预测误差最小的
+    :param engine: 'ewma' / 'holt' / 'seasonal_naive'
+    :param Y: 形状为 (时间, 列) 的数组
+    :return: (形状为 (steps, 列) 的预测值, 每列的样本内 RMSE)
+    """
+    Y = np.asarray(Y, dtype=float)
+    if Y.ndim == 1:
+        Y = Y[:, None]
+    horizon = np.arange(1, steps + 1)[:, None]
+
+    if engine == 'seasonal_naive':
+        m = min(season_length, len(Y))
+        history = pd.DataFrame(Y).ffill().to_numpy()
+        forecast = history[len(Y) - m + (horizon[:, 0] - 1) % m]
+        errors = Y[m:] - Y[:-m] if len(Y) > m else np.full((1, Y.shape[1]), np.nan)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            rmse = np.sqrt(np.nanmean(errors ** 2, axis=0))
+        return forecast, rmse
+
+    if engine == 'ewma':
+        grid = [(alpha, None) for alpha in _SMOOTHING_ALPHAS]
+    elif engine == 'holt':
+        grid = [(alpha, beta) for alpha in _SMOOTHING_ALPHAS for beta in _SMOOTHING_BETAS]
+    else:
+        raise ValueError(f"未知的快速预测方法: {engine},可选 {FAST_ENGINES}")
+
+    best_sse = np.full(Y.shape[1], np.inf)
+    best_level = np.zeros(Y.shape[1])
+    best_trend = np.zeros(Y.shape[1])
+    best_count = np.ones(Y.shape[1])
+    for alpha, beta in grid:
+        level, trend, sse, count = _smooth(Y, alpha, beta)
+        better = sse < best_sse
+        best_sse = np.where(better, sse, best_sse)
+        best_level = np.where(better, level, best_level)
+        best_trend = np.where(better, trend, best_trend)
+        best_count = np.where(better, count, best_count)
+    forecast = best_level + horizon * best_trend
+    return forecast, np.sqrt(best_sse / np.maximum(best_count, 1))
+
+
+def _holdout_mae(Y, steps, season_length=7):
+    """
+    用最后 steps 个观测做留出回测,计算各快速方法每列的 MAE
+    :return: (训练部分, 留出部分, {方法: 每列 MAE})
+    """
+    Y = np.asarray(Y, dtype=float)
+    if Y.ndim == 1:
+        Y = Y[:, None]
+    train, test = Y[:-steps], Y[-steps:]
+    scores = {}
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        for engine in FAST_ENGINES:
+            forecast, _ = _fast_forecast(engine, train, steps, season_length)
+            scores[engine] = np.nanmean(np.abs(forecast - test), axis=0)
+    return train, test, scores
+
+
+def _trend_labels(values, rise_label='上升', fall_label='下滑', flat_label='横盘'):
+    """
+    向量化的涨跌标注:按相邻差值的符号标注上升/下滑/横盘,第一个值(无前值)记为横盘
+    :param values: 一维或二维(按列)数值数组
+    :return: 与 values 形状相同的标签数组
+    """
+    values = np.asarray(values, dtype=float)
+    sign = np.sign(np.diff(values, axis=0, prepend=np.nan))
+    return np.select([sign > 0, sign < 0], [rise_label, fall_label], default=flat_label)
+
+
+def _trend_categorical(values, rise_label='上升', fall_label='下滑', flat_label='横盘'):
+    """一维序列的涨跌标注,返回 Categorical"""
+    return pd.Categorical(_trend_labels(values, rise_label, fall_label, flat_label),
+                          categories=[rise_label, fall_label, flat_label])
+
+
+def _forecast_metrics(actual, predictions):
+    """计算预测误差指标,MAPE 只在实际值非零的点上计算"""
+    actual = np.asarray(actual, dtype=float)
+    errors = np.asarray(predictions, dtype=float) - actual
+    mse = np.mean(errors ** 2)
+    nonzero = actual != 0
+    mape = np.mean(np.abs(errors[nonzero] / actual[nonzero])) * 100 if nonzero.any() else np.nan
+    return {
+        '均方误差(MSE)': round(float(mse), 4),
+        '均方根误差(RMSE)': round(float(np.sqrt(mse)), 4),
+        '平均绝对误差(MAE)': round(float(np.mean(np.abs(errors))), 4),
+        '平均绝对百分比误差(MAPE)': round(float(mape), 2)
+    }
+
+
+def _fit_fold(train, test, order, start_params=None):
+    """拟合单个回测折并计算误差指标"""
+    model_fit = ARIMA(train, order=order).fit(start_params=start_params)
+    return _forecast_metrics(test, model_fit.forecast(steps=len(test)))
+
 
 class TrendPredictor:
     def __init__(self, market_trend_df, date_col, smoothed_avg_col,
                  rise_label='上升', fall_label='下滑', flat_label='横盘',
-                 freq='B', order=None, steps=7, sortdata='逆序'):
+                 freq='B', order=None, steps=7, sortdata='逆序',
+                 auto_order=False, max_p=3, max_q=3, criterion='aic', n_jobs=1, time_budget=None,
+                 model_store=None, refit_every=None, trend_labels=True,
+                 engine='arima', season_length=7):
+        """
+        :param auto_order: 是否自动选择 ARIMA 阶数(由 ADF 检验确定 d,按 AIC/BIC 网格搜索 p、q)
+        :param max_p: 自动定阶时 p 的上限
+        :param max_q: 自动定阶时 q 的上限
+        :param criterion: 自动定阶的准则,'aic' 或 'bic'
+        :param n_jobs: 自动定阶时并行评估候选的进程数,-1 使用全部 CPU
+        :param time_budget: 自动定阶的总时间预算(秒),超时未完成的候选被剪枝
+        :param model_store: 模型持久化目录,按数据指纹和阶数保存已拟合的模型,数据未变化时跳过拟合
+        :param refit_every: 增量更新(update)多少次后做一次完整重新估计,None 表示只做增量更新
+        :param trend_labels: 是否为历史数据生成 '趋势' 列(Categorical),序列很多时可关闭以节省时间
+        :param engine: 预测方法:'arima'、快速方法 'ewma'/'holt'/'seasonal_naive',
+                       或 'auto'(留出回测比较,只有 ARIMA 更准时才使用 ARIMA)
+        :param season_length: seasonal_naive 的季节周期
+        """
+        if engine not in ENGINES:
+            raise ValueError(f"engine 只能是 {ENGINES}")
         self.market_trend_df = market_trend_df.copy()
         self.date_col = date_col
         self.smoothed_avg_col = smoothed_avg_col
@@ -23,7 +280,27 @@ class TrendPredictor:
         self.order = order if order else (5, 1, 0)
         self.steps = steps
         self.sortdata = sortdata
+        self.auto_order = auto_order
+        self.max_p = max_p
+        self.max_q = max_q
+        self.criterion = criterion.lower()
+        self.n_jobs = n_jobs
+        self.time_budget = time_budget
+        self.order_search_results = []
+        self.model_store = model_store
+        self._model_key = None
+        self._model_fit = None
+        self._forecast_key = None
+        self._forecast_result = None
+        self.refit_every = refit_every
+        self._updates_since_refit = 0
+        self.trend_labels = trend_labels
+        self.engine = engine
+        self.season_length = season_length
+        self._engine_choice = None
         self._prepare_data()
+        if self.auto_order:
+            self.order = self._select_order()
 
     def _prepare_data(self):
         if self.sortdata == '逆序':
@@ -31,8 +308,9 @@ class TrendPredictor:
         else:
             self.reversed_market_trend_df = self.market_trend_df[self.smoothed_avg_col].reset_index(drop=True)
 
-        self.market_trend_df['趋势'] = self.market_trend_df[self.smoothed_avg_col].diff().apply(
-            lambda x: self.rise_label if x > 0 else (self.fall_label if x < 0 else self.flat_label))
+        if self.trend_labels:
+            self.market_trend_df['趋势'] = _trend_categorical(
+                self.market_trend_df[self.smoothed_avg_col], self.rise_label, self.fall_label, self.flat_label)
         
         # 检查数据平稳性
         self.is_stationary = self._check_stationarity(self.reversed_market_trend_df)
@@ -44,6 +322,81 @@ class TrendPredictor:
     
 
 
+    def _select_d(self, max_d=2):
+        """根据 ADF 检验结果确定差分阶数 d"""
+        if self.is_stationary:
+            return 0
+        series = self.reversed_market_trend_df
+        for d in range(1, max_d):
+            series = series.diff().dropna()
+            if len(series) < 10 or self._check_stationarity(series):
+                return d
+        return max_d
+
+    def _select_order(self):
+        """网格搜索 (p, q),按 AIC/BIC 选择最优阶数,结果按序列指纹缓存"""
+        if self.criterion not in ('aic', 'bic'):
+            raise ValueError("criterion 只能是 'aic' 或 'bic'")
+        values = self.reversed_market_trend_df.to_numpy(dtype=float)
+        cache_key = (_series_fingerprint(values), self.max_p, self.max_q, self.criterion)
+        if cache_key in _ORDER_CACHE:
+            return _ORDER_CACHE[cache_key]
+
+        d = self._select_d()
+        # 先评估简单模型,时间预算用完时被剪掉的是最复杂的候选
+        candidates = sorted(((p, d, q) for p in range(self.max_p + 1) for q in range(self.max_q + 1)),
+                            key=lambda order: (order[0] + order[2], order))
+        deadline = time.monotonic() + self.time_budget if self.time_budget else None
+        n_jobs = min(_resolve_n_jobs(self.n_jobs), len(candidates))
+
+        results = []
+        pending = {}
+        truncated = False
+        if n_jobs <= 1 and deadline is None:
+            for order in candidates:
+                results.append(_evaluate_order(values, order))
+        else:
+            # 设置了时间预算时即使 n_jobs=1 也放到工作进程中拟合,单个拟合过慢或不收敛时同样能按时剪掉
+            executor = _process_pool(n_jobs)
+            try:
+                pending = {executor.submit(_evaluate_order, values, order): order for order in candidates}
+                while pending:
+                    timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                    done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                    if not done:
+                        break
+                    for future in done:
+                        pending.pop(future)
+                        results.append(future.result())
+                for future, order in pending.items():
+                    future.cancel()
+                    results.append((order, None, '超出时间预算'))
+                    truncated = True
+            finally:
+                if pending:
+                    # 超时仍在运行的候选直接结束工作进程,不再等待
+                    _terminate_pool(executor)
+                else:
+                    executor.shutdown()
+
+        index = 1 if self.criterion == 'aic' else 2
+        fitted = [r for r in results if r[1] is not None]
+        self.order_search_results = []
+        for order, aic, extra in results:
+            if aic is None:
+                self.order_search_results.append({'order': order, '剪枝原因': extra})
+            else:
+                self.order_search_results.append({'order': order, 'aic': round(aic, 2), 'bic': round(extra, 2)})
+        if not fitted:
+            print(f"自动定阶没有可用的候选,使用默认阶数 {self.order}")
+            return self.order
+
+        best = min(fitted, key=lambda r: r[index])[0]
+        if not truncated:
+            # 被时间预算截断的搜索结果不完整,不缓存,以免之后的完整搜索直接用它
+            _ORDER_CACHE[cache_key] = best
+        return best
+
     def original_data(self):
         return self.market_trend_df
 
@@ -56,38 +409,182 @@ class TrendPredictor:
             color = 'black'
         return f'color: {color}'
 
-    def _predict(self):
-        # 使用最佳参数或用户指定参数创建ARIMA模型
-        model = ARIMA(self.reversed_market_trend_df, order=self.order)
-        model_fit = model.fit()
-        
-        # 获取预测结果及置信区间
-        forecast_result = model_fit.forecast(steps=self.steps, alpha=0.05)
-        forecast = forecast_result.tolist() if isinstance(forecast_result, np.ndarray) else forecast_result
-        forecast = [round(x, 4) for x in forecast]
+    def _model_store_path(self, key):
+        fingerprint, order = key
+        return os.path.join(self.model_store, f"arima_{fingerprint}_{'_'.join(map(str, order))}.pkl")
 
-        last_value = self.market_trend_df[self.smoothed_avg_col][
-            self.market_trend_df[self.date_col] == self.market_trend_df[self.date_col].max()].tolist()[0]
-        forecast.insert(0, last_value)
+    def _load_model(self, key):
+        """
+        从模型目录加载已拟合的模型,不存在或损坏时返回 (None, 0)
+        :return: (模型, 上次完整拟合后的增量更新次数)
+        """
+        if not self.model_store:
+            return None, 0
+        path = self._model_store_path(key)
+        if not os.path.exists(path):
+            return None, 0
+        try:
+            with open(path, 'rb') as f:
+                stored = pickle.load(f)
+        except Exception as e:
+            print(f"模型文件加载失败,重新拟合: {e}")
+            return None, 0
+        if isinstance(stored, dict):
+            return stored['model'], stored.get('updates_since_refit', 0)
+        # 兼容只保存了模型本身的旧文件
+        return stored, 0
 
-        future_dates = pd.date_range(start=self.market_trend_df[self.date_col].max(), periods=len(forecast),
-                                     freq=self.freq)
-        future_forecast_df = pd.DataFrame({self.date_col: future_dates.date, '预测值': forecast})
-        future_forecast_df['趋势'] = future_forecast_df['预测值'].diff().apply(
-            lambda x: self.rise_label if x > 0 else (self.fall_label if x < 0 else self.flat_label))
+    def _save_model(self, key, model_fit, updates_since_refit=0):
+        """保存模型和增量更新次数,每天新进程运行时也能按 refit_every 计划完整重拟合"""
+        if not self.model_store:
+            return
+        os.makedirs(self.model_store, exist_ok=True)
+        path = self._model_store_path(key)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'model': model_fit, 'updates_since_refit': updates_since_refit}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
 
-        # 添加模型评估指标
+    def _model_metrics(self, model_fit):
         if len(self.reversed_market_trend_df) > 10:
-            self.model_metrics = {
+            return {
                 'AIC': round(model_fit.aic, 2),
                 'BIC': round(model_fit.bic, 2),
                 'RMSE': round(np.sqrt(model_fit.mse), 4)
             }
+        return {'注意': '数据量不足，无法计算可靠的模型评估指标'}
+
+    def _fit_model(self, refit=False):
+        """
+        拟合 ARIMA 模型,按 (数据指纹, 阶数) 缓存,数据和阶数不变时不重复拟合
+        :param refit: 为 True 时跳过内存和模型目录中的模型,完整重新估计
+        """
+        key = (_series_fingerprint(self.reversed_market_trend_df), tuple(self.order))
+        if key == self._model_key and not refit:
+            return self._model_fit
+
+        model_fit = None
+        if not refit:
+            model_fit, self._updates_since_refit = self._load_model(key)
+        if model_fit is None:
+            # 使用最佳参数或用户指定参数创建ARIMA模型
+            model = ARIMA(self.reversed_market_trend_df, order=self.order)
+            model_fit = model.fit()
+            self._updates_since_refit = 0
+            self._save_model(key, model_fit)
+
+        self._model_key = key
+        self._model_fit = model_fit
+        self.model_metrics = self._model_metrics(model_fit)
+        return model_fit
+
+    def update(self, new_rows):
+        """
+        追加新观测值并增量更新模型:沿用已估计的参数扩展状态(statsmodels append, refit=False),
+        不重新估计参数;达到 refit_every 次后做一次完整拟合。engine 不是 'arima' 时只追加数据
+        :param new_rows: 包含日期列和数值列的 DataFrame,早于或等于现有最新日期的行会被忽略
+        :return: self,便于链式调用
+        """
+        last_date = self.market_trend_df[self.date_col].max()
+        new_rows = new_rows[new_rows[self.date_col] > last_date].sort_values(self.date_col)
+        if new_rows.empty:
+            return self
+
+        incremental = self.engine == 'arima'
+        if incremental:
+            model_fit = self._fit_model()
+        old_length = len(self.reversed_market_trend_df)
+
+        if self.sortdata == '逆序':
+            self.market_trend_df = pd.concat([new_rows[::-1], self.market_trend_df], ignore_index=True)
+        else:
+            self.market_trend_df = pd.concat([self.market_trend_df, new_rows], ignore_index=True)
+        self._prepare_data()
+
+        if not incremental:
+            # 快速方法直接在新数据上重新计算,auto 模式重新回测选择方法
+            return self
+
+        self._updates_since_refit += 1
+        if self.refit_every and self._updates_since_refit >= self.refit_every:
+            # 按计划完整重新估计,不使用模型目录中可能由增量更新得到的模型
+            self._fit_model(refit=True)
+            return self
+
+        new_values = self.reversed_market_trend_df[old_length:]
+        model_fit = model_fit.append(new_values, refit=False)
+        key = (_series_fingerprint(self.reversed_market_trend_df), tuple(self.order))
+        self._save_model(key, model_fit, self._updates_since_refit)
+        self._model_key = key
+        self._model_fit = model_fit
+        self.model_metrics = self._model_metrics(model_fit)
+        return self
+
+    def _resolve_engine(self):
+        """engine='auto' 时用最后 steps 个观测做留出回测,选出误差最小的方法(按数据指纹缓存)"""
+        if self.engine != 'auto':
+            return self.engine
+        fingerprint = _series_fingerprint(self.reversed_market_trend_df)
+        if self._engine_choice and self._engine_choice[0] == fingerprint:
+            return self._engine_choice[1]
+
+        values = self.reversed_market_trend_df.to_numpy(dtype=float)
+        if len(values) < self.steps + 10:
+            chosen = 'arima'
         else:
-            self.model_metrics = {'注意': '数据量不足，无法计算可靠的模型评估指标'}
+            train, test, scores = _holdout_mae(values, self.steps, self.season_length)
+            scores = {engine: score[0] for engine, score in scores.items()}
+            try:
+                arima_forecast = ARIMA(train[:, 0], order=self.order).fit().forecast(steps=self.steps)
+                scores['arima'] = np.nanmean(np.abs(np.asarray(arima_forecast) - test[:, 0]))
+            except Exception as e:
+                print(f"ARIMA 回测失败,仅比较快速方法: {e}")
+            chosen = min(scores, key=lambda engine: scores[engine])
+        self._engine_choice = (fingerprint, chosen)
+        return chosen
+
+    def _predict(self):
+        engine = self._resolve_engine()
+        last_date = self.market_trend_df[self.date_col].max()
+        if engine == 'arima':
+            model_fit = self._fit_model()
+            model_key = self._model_key
+        else:
+            model_key = (_series_fingerprint(self.reversed_market_trend_df), engine, self.season_length)
+        key = (model_key, self.steps, last_date, self.freq)
+        if key != self._forecast_key:
+            if engine == 'arima':
+                forecast_values = model_fit.forecast(steps=self.steps)
+            else:
+                forecast_values, rmse = _fast_forecast(engine, self.reversed_market_trend_df.to_numpy(dtype=float),
+                                                       self.steps, self.season_length)
+                forecast_values = forecast_values[:, 0]
+                self.model_metrics = {'RMSE': round(float(rmse[0]), 4)}
+            self._forecast_result = self._forecast(forecast_values, last_date)
+            self._forecast_key = key
+
+        # 返回副本,调用方修改结果不会影响缓存
+        future_forecast_df, forecast, str_forecast, future_dates = self._forecast_result
+        return future_forecast_df.copy(), list(forecast), list(str_forecast), future_dates
+
+    def _forecast(self, forecast_result, last_date):
+        # 获取预测结果
+        forecast = forecast_result.tolist() if isinstance(forecast_result, (np.ndarray, pd.Series)) else forecast_result
+        forecast = [round(x, 4) for x in forecast]
+
+        last_value = self.market_trend_df[self.smoothed_avg_col][
+            self.market_trend_df[self.date_col] == last_date].tolist()[0]
+        forecast.insert(0, last_value)
+
+        future_dates = pd.date_range(start=last_date, periods=len(forecast),
+                                     freq=self.freq)
+        future_forecast_df = pd.DataFrame({self.date_col: future_dates.date, '预测值': forecast})
+        future_forecast_df['趋势'] = _trend_categorical(
+            forecast, self.rise_label, self.fall_label, self.flat_label)
 
         future_forecast_df = pd.DataFrame(
-            future_forecast_df[future_forecast_df[self.date_col] > self.market_trend_df[self.date_col].max()],
+            future_forecast_df[future_forecast_df[self.date_col] > last_date],
             columns=[self.date_col, "预测值", '趋势'])
 
         return future_forecast_df, forecast, list(map(str, forecast)), future_dates
@@ -106,48 +603,94 @@ class TrendPredictor:
 
         return future7_df, forecast, str_forecast, future_dates
     
-    def get_model_info(self):
-        """返回模型信息和评估指标"""
+    def get_model_info(self, fit=True):
+        """
+        返回模型信息和评估指标
+        :param fit: 尚未拟合时是否先拟合模型(使用缓存,不会重复拟合)
+        """
+        engine = self._resolve_engine() if fit or self.engine != 'auto' else self.engine
+        if fit:
+            if engine == 'arima':
+                self._fit_model()
+            else:
+                self._predict()
         info = {
-            '模型参数': f"ARIMA{self.order}",
+            '模型参数': f"ARIMA{self.order}" if engine == 'arima' else engine,
+            '阶数选择': f"自动({self.criterion.upper()})" if self.auto_order else '指定',
             '数据是否平稳': "是" if self.is_stationary else "否",
             '预测步数': self.steps
         }
         
-        # 如果已经进行过预测，添加模型评估指标
+        # 如果已经拟合过模型，添加模型评估指标
         if hasattr(self, 'model_metrics'):
             info.update(self.model_metrics)
             
         return info
     
-    def cross_validate(self, test_size=0.2):
-        """使用时间序列交叉验证评估模型性能"""
-        if len(self.reversed_market_trend_df) < 10:
+    def cross_validate(self, test_size=0.2, n_folds=1, horizon=None, n_jobs=1, refit=True):
+        """
+        使用时间序列交叉验证评估模型性能
+        n_folds=1 时为单次训练/测试划分;n_folds>1 时为滚动起点(扩展窗口)回测:
+        测试区间为最后 test_size 比例的数据,每折用起点之前的全部数据训练,预测其后 horizon 步
+        :param test_size: 测试区间占比
+        :param n_folds: 折数
+        :param horizon: 每折预测步数,默认按测试区间和折数均分
+        :param n_jobs: 并行拟合各折的进程数,-1 使用全部 CPU
+        :param refit: True 时每折以第一折的参数作为初值重新估计;False 时沿用第一折的参数只扩展状态,速度最快
+        :return: 评估指标;多折时为各折平均值,并在 '各折结果' 中给出每折指标
+        """
+        values = self.reversed_market_trend_df.to_numpy(dtype=float)
+        n = len(values)
+        if n < 10:
             return {'错误': '数据量不足，无法进行交叉验证'}
-            
-        # 划分训练集和测试集
-        train_size = int(len(self.reversed_market_trend_df) * (1 - test_size))
-        train, test = self.reversed_market_trend_df[:train_size], self.reversed_market_trend_df[train_size:]
-        
-        # 使用训练集拟合模型
-        model = ARIMA(train, order=self.order)
-        model_fit = model.fit()
-        
-        # 预测测试集
-        predictions = model_fit.forecast(steps=len(test))
-        
-        # 计算评估指标
-        mse = np.mean((predictions - test) ** 2)
-        rmse = np.sqrt(mse)
-        mae = np.mean(np.abs(predictions - test))
-        mape = np.mean(np.abs((test - predictions) / test)) * 100
-        
-        return {
-            '均方误差(MSE)': round(mse, 4),
-            '均方根误差(RMSE)': round(rmse, 4),
-            '平均绝对误差(MAE)': round(mae, 4),
-            '平均绝对百分比误差(MAPE)': round(mape, 2)
-        }
+
+        if n_folds <= 1:
+            # 划分训练集和测试集
+            train_size = int(n * (1 - test_size))
+            return _fit_fold(values[:train_size], values[train_size:], self.order)
+
+        test_len = max(int(n * test_size), n_folds)
+        horizon = horizon or max(1, test_len // n_folds)
+        last_origin = n - horizon
+        step = max(1, (test_len - horizon) // (n_folds - 1))
+        origins = sorted({last_origin - i * step for i in range(n_folds)})
+        origins = [origin for origin in origins if origin >= 10]
+        if not origins:
+            return {'错误': '数据量不足，无法进行交叉验证'}
+
+        # 第一折(训练集最短)完整拟合,后续各折复用它的参数
+        first_fit = ARIMA(values[:origins[0]], order=self.order).fit()
+        folds = [_forecast_metrics(values[origins[0]:origins[0] + horizon],
+                                   first_fit.forecast(steps=horizon))]
+        rest = origins[1:]
+        if not refit:
+            model_fit = first_fit
+            previous = origins[0]
+            for origin in rest:
+                model_fit = model_fit.append(values[previous:origin], refit=False)
+                previous = origin
+                folds.append(_forecast_metrics(values[origin:origin + horizon], model_fit.forecast(steps=horizon)))
+        else:
+            start_params = first_fit.params
+            args = [(values[:origin], values[origin:origin + horizon], self.order, start_params)
+                    for origin in rest]
+            n_jobs = min(_resolve_n_jobs(n_jobs), len(args)) if args else 1
+            if n_jobs <= 1:
+                folds.extend(_fit_fold(*arg) for arg in args)
+            else:
+                with _process_pool(n_jobs) as executor:
+                    folds.extend(executor.map(_fit_fold, *zip(*args)))
+
+        for origin, fold in zip(origins, folds):
+            fold['训练集大小'] = origin
+        result = {}
+        for key in ('均方误差(MSE)', '均方根误差(RMSE)', '平均绝对误差(MAE)', '平均绝对百分比误差(MAPE)'):
+            scores = [fold[key] for fold in folds if not np.isnan(fold[key])]
+            result[key] = round(float(np.mean(scores)), 4 if 'MAPE' not in key else 2) if scores else np.nan
+        result['折数'] = len(folds)
+        result['预测步数'] = horizon
+        result['各折结果'] = folds
+        return result
         
 # Example usage:
 # Assuming market_trend_df is a DataFrame with columns '日期' and '平滑平均'
@@ -156,89 +699,859 @@ class TrendPredictor:
 # future_forecast_df, forecast, str_forecast, future_dates = predictor.forecast_data()
 # future7_df, forecast, str_forecast, future_dates = predictor.styled_forecast_data()
 class MultipleTrendPredictor():
-    def __init__(self, market_trend_df, freq='B', order=(5, 1, 0), steps=7):
+    def __init__(self, market_trend_df, freq='B', order=(5, 1, 0), steps=7,
+                 n_jobs=1, chunk_size=None, blas_threads=1,
+                 trend_labels=False, rise_label='上升', fall_label='下滑', flat_label='横盘',
+                 engine='arima', season_length=7):
+        """
+        :param n_jobs: 并行进程数,1 为单进程,-1 使用全部 CPU
+        :param chunk_size: 每个进程任务包含的列数,默认按列数和进程数自动计算
+        :param blas_threads: 每个工作进程的 BLAS 线程数
+        :param trend_labels: 是否为预测结果生成涨跌标注,结果保存在 self.trend_df
+        :param engine: 预测方法:'arima'、快速方法 'ewma'/'holt'/'seasonal_naive'(所有列一次向量化计算),
+                       或 'auto'(逐列留出回测,只有 ARIMA 更准的列才用 ARIMA),各列选用的方法保存在 self.engine_choice
+        :param season_length: seasonal_naive 的季节周期
+        """
+        if engine not in ENGINES:
+            raise ValueError(f"engine 只能是 {ENGINES}")
         self.market_trend_df = market_trend_df.copy()
         self.freq = freq
         self.order = order
         self.steps = steps
+        self.n_jobs = n_jobs
+        self.chunk_size = chunk_size
+        self.blas_threads = blas_threads
+        self.trend_labels = trend_labels
+        self.rise_label = rise_label
+        self.fall_label = fall_label
+        self.flat_label = flat_label
+        self.engine = engine
+        self.season_length = season_length
+        self.errors = {}
+        self.trend_df = None
+        self.engine_choice = {}
+
+    def _fit_all(self, items):
+        """按块分发各列的拟合任务,返回 {列名: (预测值, 错误信息)}"""
+        n_jobs = min(_resolve_n_jobs(self.n_jobs), len(items)) if items else 1
+        if n_jobs <= 1:
+            return {name: (forecast, error)
+                    for name, forecast, error in _fit_forecast_chunk(items, self.order, self.steps)}
+
+        # 每个进程分到多个块,兼顾负载均衡和进程间通信开销
+        chunk_size = self.chunk_size or max(1, math.ceil(len(items) / (n_jobs * 4)))
+        chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+        fitted = {}
+        with _process_pool(n_jobs, self.blas_threads) as executor:
+            for results in executor.map(_fit_forecast_chunk, chunks,
+                                        [self.order] * len(chunks), [self.steps] * len(chunks)):
+                for name, forecast, error in results:
+                    fitted[name] = (forecast, error)
+        return fitted
+
+    def _label_predictions(self, predictions):
+        """
+        以最后一个观测值为起点,对所有列的预测值一次性做涨跌标注;
+        非数值的最后观测值按缺失处理,预测失败的列标注为缺失,不影响其他列
+        """
+        last = self.market_trend_df.iloc[-1:].apply(pd.to_numeric, errors='coerce')
+        values = np.vstack([last.to_numpy(dtype=float), predictions.to_numpy(dtype=float)])
+        labels = _trend_labels(values, self.rise_label, self.fall_label, self.flat_label)[1:]
+        dtype = pd.CategoricalDtype([self.rise_label, self.fall_label, self.flat_label])
+        trend_df = pd.DataFrame(labels, index=predictions.index, columns=predictions.columns).astype(dtype)
+        for column in predictions.columns:
+            if column in self.errors:
+                trend_df[column] = pd.Categorical([np.nan] * len(trend_df), dtype=dtype)
+        return trend_df
 
-    def predict(self):
+    def _fit_engine(self, items):
+        """按 engine 计算各列预测,返回 {列名: (预测值, 错误信息)}"""
+        columns = [column for column, _ in items]
+        if self.engine == 'arima':
+            self.engine_choice = dict.fromkeys(columns, 'arima')
+            return self._fit_all(items)
+
+        try:
+            Y = self.market_trend_df[columns].to_numpy(dtype=float)
+        except (TypeError, ValueError):
+            # 含非数值列时逐列处理,失败的列记录错误
+            return self._fit_engine_by_column(items)
+
+        if self.engine in FAST_ENGINES:
+            self.engine_choice = dict.fromkeys(columns, self.engine)
+            forecast, _ = _fast_forecast(self.engine, Y, self.steps, self.season_length)
+            return {column: (forecast[:, i], None) for i, column in enumerate(columns)}
+
+        # auto:快速方法与 ARIMA 在留出区间上比较,只对 ARIMA 胜出的列做完整 ARIMA 拟合
+        if len(Y) < self.steps + 10:
+            self.engine_choice = dict.fromkeys(columns, 'arima')
+            return self._fit_all(items)
+        train, test, scores = _holdout_mae(Y, self.steps, self.season_length)
+        backtest = self._fit_all([(column, train[:, i]) for i, column in enumerate(columns)])
+        fast_forecasts = {}
+        arima_items = []
+        for i, column in enumerate(columns):
+            column_scores = {engine: score[i] for engine, score in scores.items() if not np.isnan(score[i])}
+            arima_forecast, error = backtest[column]
+            if error is None:
+                column_scores['arima'] = np.nanmean(np.abs(arima_forecast - test[:, i]))
+            chosen = min(column_scores, key=lambda engine: column_scores[engine]) if column_scores else 'arima'
+            self.engine_choice[column] = chosen
+            if chosen == 'arima':
+                arima_items.append(items[i])
+            else:
+                fast_forecasts.setdefault(chosen, []).append(i)
+
+        fitted = self._fit_all(arima_items) if arima_items else {}
+        for engine, indexes in fast_forecasts.items():
+            forecast, _ = _fast_forecast(engine, Y[:, indexes], self.steps, self.season_length)
+            for j, i in enumerate(indexes):
+                fitted[columns[i]] = (forecast[:, j], None)
+        return fitted
+
+    def _fit_engine_by_column(self, items):
+        fitted = {}
+        numeric = []
+        for column, values in items:
+            try:
+                numeric.append((column, np.asarray(values, dtype=float)))
+            except (TypeError, ValueError) as e:
+                fitted[column] = (None, f"{type(e).__name__}: {e}")
+        if numeric:
+            sub = MultipleTrendPredictor(pd.DataFrame(dict(numeric), index=self.market_trend_df.index),
+                                         freq=self.freq, order=self.order, steps=self.steps,
+                                         n_jobs=self.n_jobs, chunk_size=self.chunk_size,
+                                         blas_threads=self.blas_threads, engine=self.engine,
+                                         season_length=self.season_length)
+            fitted.update(sub._fit_engine(numeric))
+            self.engine_choice.update(sub.engine_choice)
+        return fitted
+
+    def predict(self, return_errors=False):
+        """
+        逐列预测(默认 ARIMA,见 engine 参数),单列拟合失败时该列为 NaN,错误信息记录在 self.errors
+        :param return_errors: True 时返回 (预测结果, {列名: 错误信息})
+        """
         # 按索引的时间顺序排序
         self.market_trend_df = self.market_trend_df.sort_index(ascending=True)
+        self.engine_choice = {}
 
-        # 预测函数
-        def predict_next_days(series, days):
-            model = ARIMA(series, order=self.order)
-            model_fit = model.fit()
-            forecast = model_fit.forecast(steps=days)
-            return forecast
+        items = [(column, self.market_trend_df[column].to_numpy())
+                 for column in self.market_trend_df.columns]
+        fitted = self._fit_engine(items)
 
         # 预测
         predictions = pd.DataFrame()
-        for column in self.market_trend_df.columns:
-            predictions[column] = predict_next_days(self.market_trend_df[column].reset_index(drop=True), self.steps)
+        self.errors = {}
+        for column, _ in items:
+            forecast, error = fitted[column]
+            if error is not None:
+                self.errors[column] = error
+                forecast = np.full(self.steps, np.nan)
+            predictions[column] = forecast
+        if self.errors:
+            print(f"{len(self.errors)} 列预测失败: {list(self.errors)[:10]}")
 
         # 创建预测结果数据框
         last_date = self.market_trend_df.index.max()+ pd.Timedelta(days=1)
         future_dates = pd.date_range(start=last_date, freq=self.freq, periods=self.steps)
         predictions.index = future_dates
+        if self.trend_labels:
+            self.trend_df = self._label_predictions(predictions)
+        if return_errors:
+            return predictions, self.errors
         return predictions
 
+class _CsvSink:
+    def __init__(self, path, columns):
+        self._file = open(path, 'w', newline='', encoding='utf-8-sig')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(columns)
+
+    def write(self, frame):
+        self._writer.writerows(frame.itertuples(index=False, name=None))
+
+    def close(self):
+        self._file.close()
+
+
+class _ExcelSink:
+    """只写模式的 Excel 输出,超过单表行数上限时续写到新工作表"""
+    def __init__(self, path, columns, sheet='预测结果'):
+        self.path = path
+        self.columns = list(columns)
+        self.sheet = sheet
+        self._workbook = Workbook(write_only=True)
+        self._part = 0
+        self._rows = 0
+        self._new_sheet()
+
+    def _new_sheet(self):
+        self._part += 1
+        self._worksheet = self._workbook.create_sheet(_rollover_sheet_title(self.sheet, self._part))
+        self._worksheet.append(self.columns)
+        self._rows = 1
+
+    def write(self, frame):
+        for row in frame.itertuples(index=False, name=None):
+            if self._rows >= EXCEL_MAX_ROWS:
+                self._new_sheet()
+            self._worksheet.append(row)
+            self._rows += 1
+
+    def close(self):
+        self._workbook.save(self.path)
+
+
+class _ParquetSink:
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("写入 Parquet 需要安装 pyarrow: pip install pyarrow") from e
+        self._pa = pa
+        self._pq = pq
+        self.path = path
+        self._writer = None
+        self._empty = None
+
+    def write(self, frame):
+        # 文件 schema 取自第一批写入的数据;整批失败的空表列类型为 null,不能用来建 schema
+        if frame.empty:
+            self._empty = frame
+            return
+        table = self._pa.Table.from_pandas(frame, preserve_index=False)
+        if self._writer is None:
+            self._writer = self._pq.ParquetWriter(self.path, table.schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is None and self._empty is not None:
+            # 全部失败时仍输出一个只有表头的文件
+            self._pq.write_table(self._pa.Table.from_pandas(self._empty, preserve_index=False), self.path)
+        if self._writer is not None:
+            self._writer.close()
+
+
+class PanelTrendPredictor:
+    """
+    长表(日期, 实体, 数值)的批量预测:整表只排序一次,按实体边界切片(不为每个实体复制 DataFrame),
+    分批交给工作进程拟合 ARIMA,结果按批写入 Parquet/Excel/CSV 或回调函数,内存占用受 max_pending 限制
+    """
+    def __init__(self, df, date_col, entity_col, value_col, order=(5, 1, 0), steps=7, freq='B',
+                 n_jobs=1, batch_size=200, max_pending=None, blas_threads=1, min_length=10):
+        """
+        :param batch_size: 每个进程任务包含的实体数
+        :param max_pending: 同时在途的批次数上限,默认 n_jobs 的 2 倍
+        :param min_length: 观测数少于该值的实体不拟合,记录到 errors
+        """
+        self.df = df
+        self.date_col = date_col
+        self.entity_col = entity_col
+        self.value_col = value_col
+        self.order = order
+        self.steps = steps
+        self.freq = freq
+        self.n_jobs = n_jobs
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.blas_threads = blas_threads
+        self.min_length = min_length
+        self.errors = {}
+
+    def _iter_batches(self):
+        """按实体切分排序后的数组,产出 [(实体, 数值切片, 最后日期), ...]"""
+        codes, entities = pd.factorize(self.df[self.entity_col], sort=False)
+        dates = pd.to_datetime(self.df[self.date_col]).to_numpy()
+        # 实体为空的行编码为 -1,不能参与切片(否则会被当成最后一个实体),单独记录后跳过
+        n_null = int((codes == -1).sum())
+        if n_null:
+            self.errors[None] = f"实体为空的 {n_null} 行已跳过"
+        sort_index = np.lexsort((dates, codes))
+        sort_index = sort_index[codes[sort_index] != -1]
+        codes = codes[sort_index]
+        dates = dates[sort_index]
+        values = self.df[self.value_col].to_numpy(dtype=float)[sort_index]
+        if not len(codes):
+            return
+
+        starts = np.concatenate(([0], np.flatnonzero(codes[1:] != codes[:-1]) + 1))
+        ends = np.append(starts[1:], len(codes))
+        batch = []
+        for start, end in zip(starts, ends):
+            entity = entities[codes[start]]
+            if end - start < self.min_length:
+                self.errors[entity] = f"观测数不足 {self.min_length}"
+                continue
+            batch.append((entity, values[start:end], dates[end - 1]))
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _open_sink(self, sink, columns):
+        if sink is None or callable(sink):
+            return None
+        path = str(sink)
+        suffix = os.path.splitext(path)[1].lower()
+        if suffix == '.parquet':
+            return _ParquetSink(path)
+        if suffix in ('.xlsx', '.xlsm'):
+            return _ExcelSink(path, columns)
+        if suffix == '.csv':
+            return _CsvSink(path, columns)
+        raise ValueError(f"不支持的输出格式: {suffix},可选 .parquet/.xlsx/.csv 或回调函数")
+
+    def _to_frame(self, batch, results):
+        last_dates = {entity: last_date for entity, _, last_date in batch}
+        entities, dates, forecasts = [], [], []
+        for entity, forecast, error in results:
+            if error is not None:
+                self.errors[entity] = error
+                continue
+            future_dates = pd.date_range(start=last_dates[entity], periods=self.steps + 1, freq=self.freq)
+            # 起点本身不一定落在频率上,只保留晚于最后日期的 steps 个日期
+            future_dates = future_dates[future_dates > last_dates[entity]][:self.steps]
+            entities.extend([entity] * len(future_dates))
+            dates.extend(future_dates)
+            forecasts.extend(np.round(forecast[:len(future_dates)], 4))
+        return pd.DataFrame({self.entity_col: entities, self.date_col: dates, '预测值': forecasts})
+
+    def predict(self, sink=None):
+        """
+        预测所有实体
+        :param sink: 输出目标:.parquet/.xlsx/.csv 文件路径,或接收每批结果 DataFrame 的回调函数;
+                     None 时汇总后返回完整 DataFrame(实体很多时不建议)
+        :return: sink 为 None 时返回预测结果 DataFrame,否则返回成功预测的实体数
+        """
+        self.errors = {}
+        columns = [self.entity_col, self.date_col, '预测值']
+        writer = self._open_sink(sink, columns)
+        collected = []
+        n_done = 0
+
+        def emit(batch, results):
+            nonlocal n_done
+            frame = self._to_frame(batch, results)
+            n_done += frame[self.entity_col].nunique()
+            if writer is not None:
+                writer.write(frame)
+            elif callable(sink):
+                sink(frame)
+            else:
+                collected.append(frame)
+
+        n_jobs = _resolve_n_jobs(self.n_jobs)
+        max_pending = self.max_pending or n_jobs * 2
+        try:
+            if n_jobs <= 1:
+                for batch in self._iter_batches():
+                    emit(batch, _fit_forecast_chunk([(e, v) for e, v, _ in batch], self.order, self.steps))
+            else:
+                with _process_pool(n_jobs, self.blas_threads) as executor:
+                    pending = {}
+                    for batch in self._iter_batches():
+                        if len(pending) >= max_pending:
+                            # 等到有批次完成再提交,保持内存有界
+                            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                            for future in done:
+                                emit(pending.pop(future), future.result())
+                        future = executor.submit(_fit_forecast_chunk, [(e, v) for e, v, _ in batch],
+                                                 self.order, self.steps)
+                        pending[future] = batch
+                    while pending:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            emit(pending.pop(future), future.result())
+        finally:
+            if writer is not None:
+                writer.close()
+
+        if self.errors:
+            print(f"{len(self.errors)} 个实体预测失败")
+        if sink is None:
+            return pd.concat(collected, ignore_index=True) if collected else pd.DataFrame(columns=columns)
+        return n_done
+
+
+_TOKENIZE_CHUNK_CHARS = 100000
+_LOADED_USER_DICTS = set()
+
+
+def _user_dict_paths(user_dict):
+    if user_dict is None:
+        return ()
+    if isinstance(user_dict, (str, os.PathLike)):
+        return (os.fspath(user_dict),)
+    return tuple(os.fspath(path) for path in user_dict)
+
+
+def _load_user_dicts(user_dicts):
+    """加载自定义词典,同一进程内每个词典只加载一次"""
+    for path in user_dicts:
+        if path not in _LOADED_USER_DICTS:
+            jieba.load_userdict(path)
+            _LOADED_USER_DICTS.add(path)
+
+
+def _init_jieba_worker(user_dicts=()):
+    """进程池初始化:预先加载 jieba 词典和自定义词典,避免首个任务才懒加载"""
+    jieba.initialize()
+    _load_user_dicts(user_dicts)
+
+
+def _split_text(text, chunk_chars=_TOKENIZE_CHUNK_CHARS):
+    """按行切分长文本(与 jieba.enable_parallel 的切分方式相同),每块约 chunk_chars 个字符"""
+    if len(text) <= chunk_chars:
+        return [text]
+    pieces, buffer, size = [], [], 0
+    for line in text.splitlines(True):
+        buffer.append(line)
+        size += len(line)
+        if size >= chunk_chars:
+            pieces.append(''.join(buffer))
+            buffer, size = [], 0
+    if buffer:
+        pieces.append(''.join(buffer))
+    return pieces
+
+
+def _count_tokens_batch(batch):
+    """在工作进程中分词计数:[(行号, 文本), ...] -> [(行号, Counter), ...]"""
+    return [(row, Counter(jieba.cut(text))) for row, text in batch]
+
+
+def _counts_to_sparse(pairs, n_rows, vocabulary=None):
+    """
+    把 (行号, Counter) 合并成稀疏词频矩阵,同一行的多个 Counter 会累加
+    :return: (csr_matrix, {词: 列号})
+    """
+    vocabulary = {} if vocabulary is None else vocabulary
+    rows, cols, data = [], [], []
+    for row, counter in pairs:
+        for word, count in counter.items():
+            rows.append(row)
+            cols.append(vocabulary.setdefault(word, len(vocabulary)))
+            data.append(count)
+    matrix = sparse.coo_matrix((data, (rows, cols)), shape=(n_rows, len(vocabulary)), dtype=np.int64)
+    return matrix.tocsr(), vocabulary
+
+
+def _sparse_to_counters(matrix, vocabulary):
+    words = np.empty(len(vocabulary), dtype=object)
+    for word, index in vocabulary.items():
+        words[index] = word
+    return [Counter(dict(zip(words[matrix.indices[start:end]], matrix.data[start:end].tolist())))
+            for start, end in zip(matrix.indptr[:-1], matrix.indptr[1:])]
+
+
+_FONT_CANDIDATES = (
+    'C:/Windows/Fonts/SimHei.ttf',
+    'C:/Windows/Fonts/msyh.ttc',
+    '/System/Library/Fonts/PingFang.ttc',
+    '/System/Library/Fonts/STHeiti Medium.ttc',
+    '/Library/Fonts/Arial Unicode.ttf',
+    '/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc',
+    '/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc',
+    '/usr/share/fonts/google-noto-cjk/NotoSansCJK-Regular.ttc',
+    '/usr/share/fonts/truetype/wqy/wqy-microhei.ttc',
+    '/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc',
+    '/usr/share/fonts/wqy-microhei/wqy-microhei.ttc',
+)
+
+
+@lru_cache(maxsize=None)
+def _find_font(font_path=None):
+    """返回指定字体,或按平台查找第一个存在的中文字体;都找不到时返回 None(使用 WordCloud 自带字体,不支持中文)"""
+    if font_path:
+        if not os.path.exists(font_path):
+            raise FileNotFoundError(f"字体文件不存在: {font_path}")
+        return font_path
+    for candidate in _FONT_CANDIDATES:
+        if os.path.exists(candidate):
+            return candidate
+    print("未找到中文字体,请通过 font_path 指定,否则中文会显示为方框")
+    return None
+
+
+@lru_cache(maxsize=8)
+def _ellipse_mask(width, height):
+    """椭圆掩码(椭圆内为 0 可绘制,外部为 255),按尺寸缓存"""
+    y, x = np.ogrid[-height // 2:height // 2, -width // 2:width // 2]
+    mask = (x ** 2 / (width // 2) ** 2 + y ** 2 / (height // 2) ** 2) <= 1
+    mask = 255 - 255 * mask.astype(int)
+    mask.flags.writeable = False
+    return mask
+
+
+@lru_cache(maxsize=8)
+def _wordcloud(width, height, max_words, font_path):
+    """按参数缓存 WordCloud 实例,同一进程中多次渲染复用"""
+    return WordCloud(
+        width=width,
+        height=height,
+        max_words=max_words,
+        font_path=font_path,
+        background_color='white',
+        mask=_ellipse_mask(width, height)
+    )
+
+
+def _render_wordcloud(word_freq, image_path=None, width=400, height=200, max_words=200, font_path=None):
+    """渲染单个词云,返回图像数组;指定 image_path 时同时保存为图片"""
+    wordcloud = _wordcloud(width, height, max_words, font_path).generate_from_frequencies(word_freq)
+    if image_path:
+        wordcloud.to_file(image_path)
+    return wordcloud.to_array()
+
+
+class SpaceSaving:
+    """
+    Space-Saving 热门词估计:最多保留 capacity 个计数器,内存有界。
+    计数是真实值的上界,误差不超过 errors 中记录的值;真实次数超过 总次数/capacity 的词一定会被保留
+    """
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError("capacity 必须大于 0")
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self._heap = []  # (计数下界, 词),计数只增不减,弹出时再校正
+
+    def update(self, word, count=1):
+        if word in self.counts:
+            self.counts[word] += count
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[word] = count
+            self.errors[word] = 0
+            heapq.heappush(self._heap, (count, word))
+            return
+        # 淘汰当前最小计数的词,新词继承其计数作为误差
+        while True:
+            stored, victim = self._heap[0]
+            current = self.counts[victim]
+            if stored == current:
+                break
+            heapq.heapreplace(self._heap, (current, victim))
+        heapq.heappop(self._heap)
+        del self.counts[victim]
+        del self.errors[victim]
+        self.counts[word] = current + count
+        self.errors[word] = current
+        heapq.heappush(self._heap, (current + count, word))
+
+    def update_counts(self, counter):
+        for word, count in counter.items():
+            self.update(word, count)
+
+    def most_common(self, k=None):
+        items = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+        return items if k is None else items[:k]
+
+
+def _load_stopwords(stopwords):
+    """停用词可以是集合/列表,或每行一个词的文件路径"""
+    if stopwords is None:
+        return frozenset()
+    if isinstance(stopwords, (str, os.PathLike)):
+        with open(stopwords, encoding='utf-8') as f:
+            return frozenset(line.strip() for line in f if line.strip())
+    return frozenset(stopwords)
+
+
+def _iter_excel_chunks(path, chunksize, sheet_name=None):
+    """以只读模式逐行读取 Excel,按 chunksize 行组成 DataFrame,首行作为表头"""
+    workbook = load_workbook(path, read_only=True)
+    try:
+        worksheet = workbook[sheet_name] if sheet_name else workbook.active
+        rows = worksheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        buffer = []
+        for row in rows:
+            buffer.append(row)
+            if len(buffer) >= chunksize:
+                yield pd.DataFrame(buffer, columns=header)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=header)
+    finally:
+        workbook.close()
+
+
+def _iter_frame_chunks(source, chunksize, sheet_name=None):
+    """把 DataFrame / CSV / Excel 路径 / DataFrame 迭代器统一成分块的 DataFrame 迭代器"""
+    if isinstance(source, pd.DataFrame):
+        for start in range(0, len(source), chunksize):
+            yield source.iloc[start:start + chunksize]
+    elif isinstance(source, (str, os.PathLike)):
+        suffix = os.path.splitext(os.fspath(source))[1].lower()
+        if suffix in ('.xlsx', '.xlsm'):
+            yield from _iter_excel_chunks(source, chunksize, sheet_name)
+        else:
+            yield from pd.read_csv(source, chunksize=chunksize)
+    else:
+        yield from source
+
+
+class TokenCache:
+    """
+    分词结果的磁盘缓存(sqlite3),键为 文本哈希 + 词典版本,值为词频。
+    词典版本包含实际生效的全部自定义词典(构造时传入的和每次调用传入的),
+    词典或自定义词典文件变化后版本随之变化,旧结果自动失效;运行时用 jieba.add_word 加词时请通过 version 区分
+    """
+    _LOOKUP_CHUNK = 500
+
+    def __init__(self, path, user_dict=None, version=None):
+        """
+        :param path: 缓存数据库文件路径
+        :param user_dict: 自定义词典路径(或列表),会被加载并计入词典版本
+        :param version: 额外的版本标识
+        """
+        self.path = path
+        self.user_dicts = _user_dict_paths(user_dict)
+        _load_user_dicts(self.user_dicts)
+        self.version = version
+        self.dictionary_version = self._dictionary_version(self.user_dicts)
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS tokens (key TEXT PRIMARY KEY, counts TEXT NOT NULL)")
+        self._conn.commit()
+
+    def _dictionary_version(self, user_dicts=None):
+        """user_dicts 为本次分词实际生效的自定义词典,None 时只用构造时传入的"""
+        if user_dicts is None:
+            user_dicts = self.user_dicts
+        parts = [jieba.__version__, str(jieba.dt.dictionary or 'default'), str(self.version)]
+        for path in sorted(set(user_dicts)):
+            stat = os.stat(path)
+            parts.append(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}")
+        return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()[:16]
+
+    def _key(self, text, dictionary_version=None):
+        return (dictionary_version or self.dictionary_version) + hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def get_many(self, texts, user_dicts=None):
+        """批量查询,返回 {文本: Counter},未命中的文本不在结果中"""
+        dictionary_version = self._dictionary_version(user_dicts)
+        keys = {self._key(text, dictionary_version): text for text in set(texts)}
+        found = {}
+        key_list = list(keys)
+        for start in range(0, len(key_list), self._LOOKUP_CHUNK):
+            chunk = key_list[start:start + self._LOOKUP_CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            for key, counts in self._conn.execute(
+                    f"SELECT key, counts FROM tokens WHERE key IN ({placeholders})", chunk):
+                found[keys[key]] = Counter(json.loads(counts))
+        return found
+
+    def put_many(self, counters, user_dicts=None):
+        """批量写入 {文本: Counter}"""
+        dictionary_version = self._dictionary_version(user_dicts)
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO tokens (key, counts) VALUES (?, ?)",
+            [(self._key(text, dictionary_version), json.dumps(counter, ensure_ascii=False)) for text, counter in counters.items()])
+        self._conn.commit()
+
+    def word_freqs(self, texts, tokenize=None, user_dicts=None):
+        """
+        返回与 texts 一一对应的词频,只对缓存未命中的文本分词
+        :param tokenize: 对未命中文本列表分词的函数,返回 Counter 列表;默认串行 jieba.cut
+        :param user_dicts: 本次分词实际生效的自定义词典路径,计入缓存键;None 时只用构造时传入的
+        """
+        texts = list(texts)
+        found = self.get_many(texts, user_dicts)
+        missing = [text for text in dict.fromkeys(texts) if text not in found]
+        self.hits += len(texts) - sum(1 for text in texts if text not in found)
+        self.misses += len(missing)
+        if missing:
+            counters = tokenize(missing) if tokenize else [Counter(jieba.cut(text)) for text in missing]
+            new = dict(zip(missing, counters))
+            self.put_many(new, user_dicts)
+            found.update(new)
+        return [found[text] for text in texts]
+
+    def clear(self):
+        self._conn.execute("DELETE FROM tokens")
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
 class TextAnalysis:
-    def __init__(self, dataframe):
+    def __init__(self, dataframe, token_cache=None):
+        """
+        :param token_cache: TokenCache 实例或缓存文件路径,设置后只对新的或变化的文本分词
+        """
         self.df = dataframe
+        self.token_cache = TokenCache(token_cache) if isinstance(token_cache, (str, os.PathLike)) else token_cache
 
-    def get_word_freq(self, group_col, text_col, agg_func):
+    def _active_user_dicts(self, user_dict):
+        """
+        加载本次调用和缓存要求的自定义词典,返回当前进程中生效的全部自定义词典
+        (jieba 词典是进程级状态,之前加载过的词典同样生效;也用于缓存键和工作进程初始化)
+        """
+        user_dicts = _user_dict_paths(user_dict)
+        if self.token_cache:
+            user_dicts = self.token_cache.user_dicts + user_dicts
+        _load_user_dicts(user_dicts)
+        return tuple(sorted(_LOADED_USER_DICTS))
+
+    def get_word_freq(self, group_col, text_col, agg_func, n_jobs=1, user_dict=None,
+                      batch_size=64, return_matrix=False):
+        """
+        按分组聚合文本并统计词频
+        :param n_jobs: 分词进程数,1 为串行;大于 1 时长文本按行切块后分发到预加载词典的进程池
+        :param user_dict: 自定义词典路径(或路径列表),串行和并行模式都会加载
+        :param batch_size: 每个进程任务包含的文本块数
+        :param return_matrix: 为 True 时额外返回稀疏词频矩阵 (csr_matrix, 行与结果行对应) 和词表 {词: 列号}
+        """
         # 聚合数据
         aggregated_text = self.df.groupby(group_col)[text_col].apply(agg_func).reset_index()
+        texts = aggregated_text[text_col].tolist()
+        user_dicts = self._active_user_dicts(user_dict)
+        n_jobs = _resolve_n_jobs(n_jobs)
+
         # 计算词频
-        aggregated_text['word_freq'] = aggregated_text[text_col].apply(self.compute_word_freq)
+        if n_jobs == 1:
+            tokenize = self._serial_word_freqs
+        else:
+            tokenize = partial(self._parallel_word_freqs, n_jobs=n_jobs, user_dicts=user_dicts,
+                               batch_size=batch_size)
+        if self.token_cache:
+            counters = self.token_cache.word_freqs(texts, tokenize, user_dicts)
+        else:
+            counters = tokenize(texts)
+
+        if return_matrix:
+            matrix, vocabulary = _counts_to_sparse(enumerate(counters), len(texts))
+        aggregated_text['word_freq'] = counters
+        if return_matrix:
+            return aggregated_text, matrix, vocabulary
         return aggregated_text
 
+    def _serial_word_freqs(self, texts):
+        return [self.compute_word_freq(text) for text in texts]
+
+    @staticmethod
+    def _parallel_word_freqs(texts, n_jobs, user_dicts, batch_size):
+        """长文本按行切块后分发到预加载词典的进程池,各块结果在稀疏矩阵中按文本累加"""
+        tasks = [(row, piece) for row, text in enumerate(texts) for piece in _split_text(text)]
+        batches = [tasks[i:i + batch_size] for i in range(0, len(tasks), batch_size)]
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_jieba_worker,
+                                 initargs=(user_dicts,)) as executor:
+            pairs = (pair for result in executor.map(_count_tokens_batch, batches) for pair in result)
+            matrix, vocabulary = _counts_to_sparse(pairs, len(texts))
+        return _sparse_to_counters(matrix, vocabulary)
+
+    def stream_word_freq(self, group_col, text_col, source=None, stopwords=None, top_k=None,
+                         sketch_size=None, chunksize=10000, sheet_name=None, user_dict=None):
+        """
+        流式统计分组词频:逐块读取、逐行分词并增量更新各组计数,不拼接整组文本
+        :param source: 数据来源,None 为 self.df;也可以是 DataFrame、CSV/Excel 路径或 DataFrame 迭代器(如 read_csv(chunksize=...))
+        :param stopwords: 停用词集合,或每行一个词的文件路径;纯空白的词总是跳过
+        :param top_k: 每组只保留出现次数最多的 top_k 个词
+        :param sketch_size: 每组最多保留的计数器个数(Space-Saving 估计),词表很大时限制内存;
+                            None 时精确计数,给定 top_k 时默认为 top_k 的 10 倍
+        :param chunksize: 每块读取的行数
+        :param sheet_name: 读取 Excel 时的工作表名,默认活动工作表
+        :return: DataFrame,列为 group_col 和 word_freq(Counter)
+        """
+        user_dicts = self._active_user_dicts(user_dict)
+        stopwords = _load_stopwords(stopwords)
+        if sketch_size is None and top_k is not None:
+            sketch_size = top_k * 10
+        counters = {}
+
+        for chunk in _iter_frame_chunks(self.df if source is None else source, chunksize, sheet_name):
+            rows = [(group, text) for group, text in zip(chunk[group_col].tolist(), chunk[text_col].tolist())
+                    if isinstance(text, str)]
+            if self.token_cache:
+                tokenized = self.token_cache.word_freqs((text for _, text in rows), user_dicts=user_dicts)
+            else:
+                tokenized = (self.compute_word_freq(text) for _, text in rows)
+            for (group, _), tokens in zip(rows, tokenized):
+                counter = counters.get(group)
+                if counter is None:
+                    counter = counters[group] = SpaceSaving(sketch_size) if sketch_size else Counter()
+                words = Counter({word: count for word, count in tokens.items()
+                                 if word not in stopwords and not word.isspace()})
+                if sketch_size:
+                    counter.update_counts(words)
+                else:
+                    counter.update(words)
+
+        groups = sorted(counters, key=str)
+        word_freqs = [Counter(dict(counters[group].most_common(top_k))) for group in groups]
+        return pd.DataFrame({group_col: groups, 'word_freq': word_freqs})
+
     def compute_word_freq(self, text):
         words = jieba.cut(text)
         return Counter(words)
 
-    def plot_wordclouds(self, word_freqs, titles, save_path="wordclouds.png"):
-        def create_ellipse_mask(width, height):
-            y, x = np.ogrid[-height // 2:height // 2, -width // 2:width // 2]
-            mask = (x ** 2 / (width // 2) ** 2 + y ** 2 / (height // 2) ** 2) <= 1
-            mask = 255 * mask.astype(int)
-            return mask
-
-        ellipse_mask = create_ellipse_mask(400, 200)
-        ellipse_mask = 255 - ellipse_mask  # 反转掩码
+    def plot_wordclouds(self, word_freqs, titles, save_path="wordclouds.png", font_path=None, n_jobs=1,
+                        output_dir=None, width=400, height=200, max_words=200, cols=2):
+        """
+        绘制多个词云并拼成网格图
+        :param font_path: 字体路径,None 时按平台查找常见中文字体
+        :param n_jobs: 渲染进程数,每个词云在进程池中单独渲染成图像数组,最后统一拼图
+        :param output_dir: 指定时每个词云另存为 output_dir/<标题>.png
+        :return: output_dir 指定时返回各词云图片路径列表
+        """
+        font_path = _find_font(font_path)
+        options = dict(width=width, height=height, max_words=max_words, font_path=font_path)
+        jobs = []
+        for word_freq, title in zip(word_freqs, titles):
+            image_path = os.path.join(output_dir, f"{title}.png") if output_dir else None
+            jobs.append((dict(word_freq), image_path))
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
 
-        num_plots = len(word_freqs)
-        cols = 2
-        rows = (num_plots + 1) // cols
+        n_jobs = min(_resolve_n_jobs(n_jobs), max(len(jobs), 1))
+        if n_jobs == 1:
+            images = [_render_wordcloud(word_freq, image_path, **options) for word_freq, image_path in jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                futures = [executor.submit(_render_wordcloud, word_freq, image_path, **options)
+                           for word_freq, image_path in jobs]
+                images = [future.result() for future in futures]
 
-        fig, axes = plt.subplots(rows, cols, figsize=(16, 8))
+        num_plots = len(images)
+        rows = max((num_plots + cols - 1) // cols, 1)
+        fig, axes = plt.subplots(rows, cols, figsize=(8 * cols, 4 * rows), squeeze=False)
 
-        for i, (word_freq, title) in enumerate(zip(word_freqs, titles)):
+        for i, (image, title) in enumerate(zip(images, titles)):
             ax = axes[i // cols, i % cols]
-            wordcloud = WordCloud(
-                width=400,
-                height=200,
-                max_words=200,
-                font_path='C:/Windows/Fonts/SimHei.ttf',
-                background_color='white',
-                mask=ellipse_mask
-            ).generate_from_frequencies(word_freq)
-
-            ax.imshow(wordcloud, interpolation='bilinear')
+            ax.imshow(image, interpolation='bilinear')
             ax.set_title(title)
             ax.axis('off')
-            ax.set_xticks([])  # 添加这行代码
-            ax.set_yticks([])  # 添加这行代码
+            ax.set_xticks([])
+            ax.set_yticks([])
 
-        for j in range(i + 1, rows * cols):
+        for j in range(num_plots, rows * cols):
             fig.delaxes(axes[j // cols, j % cols])
 
-        plt.axis('off')  # 添加这行代码
+        plt.axis('off')
         plt.tight_layout()
         plt.savefig(save_path, bbox_inches='tight')  # 保存图像
         plt.close()  # 关闭图像以释放内存
+        if output_dir:
+            return [image_path for _, image_path in jobs]
 
 # 使用示例
 # dataframe = ...  # 假设你已经有了一个 pandas DataFrame
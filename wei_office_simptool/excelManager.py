@@ -8,7 +8,12 @@ Excel 管理模块 - 提供 Excel 文件的创建、读取、写入和操作功
 - ExcelOperation: 数据处理类（拆分、合并等）
 """
 
+import queue
+import threading
 from pathlib import Path
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from time import perf_counter
 from typing import List, Optional, Sequence, Tuple, Union, Iterator, Dict, Any
 import pandas as pd
 import xlwings as xw
@@ -16,7 +21,10 @@ import openpyxl
 from openpyxl import load_workbook, Workbook
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 from openpyxl.utils import get_column_letter
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
 from openpyxl.worksheet.worksheet import Worksheet
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from .stringManager import StringBaba
 
@@ -1053,6 +1061,332 @@ def read_excel_quick(
         return manager.read_sheet(sheet_name)
 
 
+# Excel 单个工作表的最大行数
+EXCEL_MAX_ROWS = 1048576
+
+
+def _to_excel_value(value: Any) -> Any:
+    """
+    将数据库返回的值转换为 openpyxl 可写入的单元格类型
+    
+    Args:
+        value: 原始值
+        
+    Returns:
+        可直接写入单元格的值
+    """
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        # Excel 不支持带时区的时间
+        return value.replace(tzinfo=None)
+    if value is None or isinstance(value, (bool, int, float, Decimal, date, time, timedelta)):
+        return value
+    if isinstance(value, str):
+        return ILLEGAL_CHARACTERS_RE.sub("", value)
+    if isinstance(value, (bytes, bytearray)):
+        try:
+            return ILLEGAL_CHARACTERS_RE.sub("", bytes(value).decode("utf-8"))
+        except UnicodeDecodeError:
+            return bytes(value).hex()
+    if isinstance(value, (set, frozenset)):
+        # MySQL SET 类型
+        return ",".join(sorted(str(v) for v in value))
+    return ILLEGAL_CHARACTERS_RE.sub("", str(value))
+
+
+def _rollover_sheet_title(sheet_name: str, part: int) -> str:
+    """生成分页工作表名称（Excel 限制工作表名称最长 31 个字符）"""
+    if part == 1:
+        return sheet_name[:31]
+    suffix = f"_{part}"
+    return sheet_name[:31 - len(suffix)] + suffix
+
+
+def _header_cells(worksheet: Any, columns: Sequence[str]) -> List[WriteOnlyCell]:
+    """为只写工作表构造带表头样式的单元格"""
+    header_fill = PatternFill(fill_type="solid", fgColor="0070C0")
+    header_font = Font(name="Microsoft YaHei", size=11, bold=True, color="FFFFFF")
+    cells = []
+    for column in columns:
+        cell = WriteOnlyCell(worksheet, value=_to_excel_value(column))
+        cell.font = header_font
+        cell.fill = header_fill
+        cells.append(cell)
+    return cells
+
+
+def _append_rows_write_only(
+    workbook: Workbook,
+    sheet: str,
+    columns: Sequence[str],
+    rows: Iterator[Sequence[Any]],
+    include_header: bool = True,
+    rollover: bool = True
+) -> Dict[str, int]:
+    """
+    将行数据追加到只写工作簿的新工作表中，超过行数上限时续写到新工作表
+    
+    Args:
+        workbook: write_only 模式的 Workbook
+        sheet: 工作表名称
+        columns: 列名
+        rows: 行数据迭代器
+        include_header: 是否写入列名
+        rollover: 超过行数上限时是否续写到新工作表
+        
+    Returns:
+        {工作表名称: 写入的数据行数}
+    """
+    header_rows = 1 if include_header and columns else 0
+    capacity = EXCEL_MAX_ROWS - header_rows
+    written: Dict[str, int] = {}
+    worksheet = None
+    title = ""
+    part = 0
+    
+    def new_sheet():
+        nonlocal worksheet, title, part
+        part += 1
+        title = _rollover_sheet_title(sheet, part)
+        worksheet = workbook.create_sheet(title=title)
+        written[title] = 0
+        if header_rows:
+            worksheet.append(_header_cells(worksheet, columns))
+    
+    new_sheet()
+    for row in rows:
+        if written[title] >= capacity:
+            if not rollover:
+                raise ValueError(f"查询结果超过 Excel 单表行数上限 {EXCEL_MAX_ROWS}")
+            new_sheet()
+        worksheet.append([_to_excel_value(value) for value in row])
+        written[title] += 1
+    
+    return written
+
+
+def export_query_to_excel(
+    db: Any,
+    sql: str,
+    path: Union[str, Path],
+    sheet: str = "sheet1",
+    batch_size: int = 5000,
+    params: Optional[Sequence[Any]] = None,
+    include_header: bool = True,
+    rollover: bool = True
+) -> Dict[str, int]:
+    """
+    将 SQL 查询结果流式导出到 Excel（不经过完整结果集和逐单元格写入）
+    
+    通过 MySQLDatabase.stream_query 的服务端游标分批读取，直接追加到
+    openpyxl 只写模式（write_only）的工作表中，内存占用与 batch_size 相关。
+    目标文件会被覆盖。
+    
+    Args:
+        db: MySQLDatabase 实例
+        sql: 查询语句
+        path: 输出文件路径
+        sheet: 工作表名称
+        batch_size: 每批读取的行数
+        params: 查询参数（可选）
+        include_header: 是否写入列名
+        rollover: 超过 Excel 行数上限时是否自动续写到新工作表（sheet_2、sheet_3...）
+        
+    Returns:
+        {工作表名称: 写入的数据行数}
+        
+    Raises:
+        ValueError: batch_size 不合法，或 rollover=False 时数据超过行数上限
+        IOError: 保存失败
+        
+    示例:
+        >>> db = MySQLDatabase(mysql_config)
+        >>> export_query_to_excel(db, "SELECT * FROM orders", "orders.xlsx", "订单")
+        {'订单': 120000}
+    """
+    if batch_size <= 0:
+        raise ValueError("batch_size 必须大于 0")
+    
+    columns, batches = db.stream_query(sql, params, batch_size=batch_size)
+    
+    workbook = Workbook(write_only=True)
+    try:
+        rows = (row for batch in batches for row in batch)
+        written = _append_rows_write_only(workbook, sheet, columns, rows, include_header, rollover)
+    finally:
+        # 提前终止时关闭游标，释放未读取的结果
+        batches.close()
+    
+    try:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        workbook.save(str(path))
+    except Exception as e:
+        raise IOError(f"保存工作簿失败: {e}") from e
+    
+    return written
+
+
+# ============================================================================
+# ExcelReportBuilder - 多查询并发生成报表
+# ============================================================================
+
+# 工作线程读取完毕（或出错）的结束标记
+_END = object()
+
+
+class ExcelReportBuilder:
+    """
+    ExcelReportBuilder：一个查询对应一个工作表的报表构建器
+    
+    通过 MySQLDatabasePool 并发执行各个查询，工作线程只负责从服务端游标分批读取，
+    每批数据经有界队列交给主线程，由主线程按工作表顺序完成单元格类型转换并写入只写工作簿，
+    最后统一保存。并发重叠的只有查询 I/O：类型转换和写入受 GIL 限制，始终在主线程串行执行；
+    每个查询最多缓存 max_pending 批数据，内存占用与结果集大小无关。
+    
+    示例:
+        >>> pool = MySQLDatabasePool(mysql_config, size=6)
+        >>> builder = ExcelReportBuilder(pool)
+        >>> timings = builder.build({"订单": "SELECT * FROM orders", "用户": "SELECT * FROM users"}, "daily.xlsx")
+        >>> print(timings["sheets"]["订单"])
+        {'query': 1.52, 'write': 0.75, 'rows': 120000}
+    """
+    
+    def __init__(self, pool: Any, max_workers: Optional[int] = None, batch_size: int = 5000,
+                 max_pending: int = 4):
+        """
+        初始化 ExcelReportBuilder
+        
+        Args:
+            pool: MySQLDatabasePool 实例
+            max_workers: 并发线程数（可选，默认等于连接池大小）
+            batch_size: 服务端游标每批读取的行数
+            max_pending: 每个查询已读取但尚未写入的最大批数，队列满时该查询暂停读取
+        """
+        self.pool = pool
+        self.max_workers = max_workers or pool.size
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+    
+    @staticmethod
+    def _put(channel: queue.Queue, item: Any, stop: threading.Event) -> bool:
+        """向队列放入数据，主线程已放弃时返回 False"""
+        while not stop.is_set():
+            try:
+                channel.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def _run_query(self, sql: str, params: Optional[Sequence[Any]],
+                   channel: queue.Queue, stop: threading.Event) -> Dict[str, float]:
+        """在工作线程中执行查询，依次放入列名和各批原始行，结束时放入 _END"""
+        query_time = 0.0
+        try:
+            with self.pool.connection() as db:
+                t0 = perf_counter()
+                columns, batches = db.stream_query(sql, params, batch_size=self.batch_size)
+                query_time += perf_counter() - t0
+                try:
+                    if not self._put(channel, columns, stop):
+                        return {"query": query_time}
+                    while True:
+                        t0 = perf_counter()
+                        batch = next(batches, None)
+                        query_time += perf_counter() - t0
+                        if batch is None or not self._put(channel, batch, stop):
+                            break
+                finally:
+                    batches.close()
+        finally:
+            # 出错时同样放入结束标记，主线程随后从 future 取出异常
+            self._put(channel, _END, stop)
+        return {"query": query_time}
+    
+    def build(
+        self,
+        queries: Dict[str, str],
+        path: Union[str, Path],
+        params: Optional[Dict[str, Sequence[Any]]] = None,
+        include_header: bool = True,
+        rollover: bool = True
+    ) -> Dict[str, Any]:
+        """
+        并发执行所有查询并生成工作簿（目标文件会被覆盖）
+        
+        Args:
+            queries: {工作表名称: SQL}，工作表顺序与字典顺序一致
+            path: 输出文件路径
+            params: {工作表名称: 查询参数}（可选）
+            include_header: 是否写入列名
+            rollover: 超过行数上限时是否续写到新工作表
+            
+        Returns:
+            各阶段耗时（秒），write 包含类型转换，不含等待查询的时间：
+            {"sheets": {工作表: {"query", "write", "rows"}}, "save": ..., "total": ...}
+        """
+        if not queries:
+            raise ValueError("queries 不能为空")
+        
+        params = params or {}
+        start = perf_counter()
+        workbook = Workbook(write_only=True)
+        sheet_timings: Dict[str, Dict[str, float]] = {}
+        channels = {name: queue.Queue(maxsize=self.max_pending) for name in queries}
+        stop = threading.Event()
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # 按工作表顺序提交，正在写入的工作表对应的查询总是已经在执行
+            futures = {
+                name: executor.submit(self._run_query, sql, params.get(name), channels[name], stop)
+                for name, sql in queries.items()
+            }
+            try:
+                for name, future in futures.items():
+                    channel = channels[name]
+                    columns = channel.get()
+                    if columns is _END:
+                        future.result()
+                        raise RuntimeError(f"查询 {name} 未返回结果")
+                    
+                    wait_time = 0.0
+                    
+                    def rows():
+                        nonlocal wait_time
+                        while True:
+                            t0 = perf_counter()
+                            batch = channel.get()
+                            wait_time += perf_counter() - t0
+                            if batch is _END:
+                                return
+                            yield from batch
+                    
+                    t0 = perf_counter()
+                    written = _append_rows_write_only(workbook, name, columns, rows(), include_header, rollover)
+                    write_time = perf_counter() - t0 - wait_time
+                    timing = future.result()
+                    timing["write"] = write_time
+                    timing["rows"] = sum(written.values())
+                    sheet_timings[name] = {k: round(v, 4) if isinstance(v, float) else v
+                                           for k, v in timing.items()}
+            finally:
+                # 写入出错时通知仍在读取的工作线程退出，避免阻塞在已满的队列上
+                stop.set()
+        
+        t0 = perf_counter()
+        try:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            workbook.save(str(path))
+        except Exception as e:
+            raise IOError(f"保存工作簿失败: {e}") from e
+        save_time = perf_counter() - t0
+        
+        return {
+            "sheets": sheet_timings,
+            "save": round(save_time, 4),
+            "total": round(perf_counter() - start, 4),
+        }
+
+
 # ============================================================================
 # 模块导出
 # ============================================================================
@@ -1064,9 +1398,11 @@ __all__ = [
     "ExcelHandler",
     "OpenExcel",
     "ExcelOperation",
+    "ExcelReportBuilder",
     
     # 便捷函数
     "quick_excel",
     "read_excel_quick",
     "create_workbook",
+    "export_query_to_excel",
 ]
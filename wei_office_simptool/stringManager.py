@@ -1,10 +1,64 @@
 import base64
+import io
+import re
 from datetime import date, time,datetime,timedelta
+from functools import lru_cache
 import time
 
+import numpy as np
 import pandas as pd
 
 
+def _trie_regex(keywords):
+    """把关键词构建成前缀树再转成正则,共同前缀只匹配一次;只需判断是否命中,较长关键词被较短前缀覆盖"""
+    trie = {}
+    for word in keywords:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def build(node):
+        if '' in node:
+            return ''
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items())]
+        return branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """
+    多关键词子串匹配:关键词编译成一个前缀树正则,构建一次可重复使用,
+    匹配时每个字符串只扫描一遍,不再逐个关键词做 in 判断
+    """
+
+    def __init__(self, keywords):
+        self.keywords = tuple(dict.fromkeys(keywords))
+        self._match_all = '' in self.keywords
+        self._pattern = re.compile(_trie_regex(self.keywords)) if self.keywords and not self._match_all else None
+
+    def search(self, text):
+        """text 是否包含任一关键词"""
+        if self._match_all:
+            return True
+        return self._pattern is not None and self._pattern.search(text) is not None
+
+    def mask(self, texts):
+        """批量匹配,返回布尔数组,可直接用于 DataFrame/Series 筛选;非字符串视为不匹配"""
+        texts = list(texts)
+        return np.fromiter((isinstance(text, str) and self.search(text) for text in texts),
+                           dtype=bool, count=len(texts))
+
+    def filter(self, texts):
+        return [text for text in texts if isinstance(text, str) and self.search(text)]
+
+
+@lru_cache(maxsize=32)
+def _cached_matcher(keywords):
+    return KeywordMatcher(keywords)
+
+
 class StringBaba:
     def __init__(self, input_string):
         self.input_string = input_string
@@ -20,14 +74,108 @@ class StringBaba:
         formatted_output = f'"{formatted_output}"'
         return formatted_output
 
+    def iter_format_string_sql(self, chunk_size=1000, path=None, encoding='utf-8'):
+        """
+        format_string_sql 的流式版本:逐行读取、去除首尾空白并去重(跳过空行),每 chunk_size 个值生成一段 "a","b",...
+        可分别用于多条查询,不需要在内存中拼出完整字符串;值中的引号和反斜杠会被转义
+        :param path: 从文件逐行读取;不指定时读取 input_string(字符串、文件对象或任意行迭代器)
+        """
+        if path is not None:
+            with open(path, encoding=encoding) as f:
+                yield from self._quoted_chunks(f, chunk_size)
+        elif isinstance(self.input_string, str):
+            yield from self._quoted_chunks(io.StringIO(self.input_string), chunk_size)
+        else:
+            yield from self._quoted_chunks(self.input_string, chunk_size)
+
+    @staticmethod
+    def _quoted_chunks(lines, chunk_size):
+        seen = set()
+        chunk = []
+        for line in lines:
+            value = line.strip()
+            if not value or value in seen:
+                continue
+            seen.add(value)
+            chunk.append(f'"{escape_sql_literal(value)}"')
+            if len(chunk) >= chunk_size:
+                yield ','.join(chunk)
+                chunk = []
+        if chunk:
+            yield ','.join(chunk)
+
     def filter_string_list(self,filter_list):
-        filtered_list = [s for s in self.input_string if any(keyword in s for keyword in filter_list)]
-        return filtered_list
+        # 相同的关键词列表复用已编译的匹配器
+        matcher = _cached_matcher(tuple(filter_list))
+        return [s for s in self.input_string if matcher.search(s)]
+
+# 按优先级尝试的日期格式,都不匹配时再用 pandas 推断(format='ISO8601'、'mixed')兜底
+DATETIME_FORMATS = (
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d',
+    '%Y/%m/%d %H:%M:%S',
+    '%Y/%m/%d',
+    '%Y-%m-%d %H:%M',
+    '%Y/%m/%d %H:%M',
+    '%Y%m%d',
+    '%Y年%m月%d日',
+)
+
+
+def _present_mask(series):
+    """None、NaN/NaT 和空字符串视为缺失,不参与解析"""
+    return series.notna() & ~series.astype(str).str.strip().eq('')
+
+
+def _parse_unique(values, formats=DATETIME_FORMATS, fallback=True):
+    """
+    解析去重后的值:每个格式只作用于尚未解析的剩余部分,一次向量化完成
+    :param fallback: 为 True 时剩余部分再交给 pandas 推断(ISO8601,然后 mixed)
+    :return: ({原值: Timestamp}, [无法解析的值])
+    """
+    remaining = pd.Series(list(values), dtype=object)
+    text = remaining.map(str).str.strip()
+    parsed = {}
+    for fmt in list(formats) + (['ISO8601', 'mixed'] if fallback else []):
+        if remaining.empty:
+            break
+        result = pd.to_datetime(text, format=fmt, errors='coerce')
+        hit = result.notna().to_numpy()
+        parsed.update(zip(remaining[hit], result[hit]))
+        remaining, text = remaining[~hit], text[~hit]
+    return parsed, remaining.tolist()
+
+
+def _infer_formats(values, candidates=DATETIME_FORMATS, sample_size=1000):
+    """
+    抽样推断列中使用的日期格式:每轮选出能解析最多剩余样本的格式,直到样本全部解析或没有格式可用
+    :return: 按覆盖样本数排序的格式列表
+    """
+    sample = pd.Series(list(values), dtype=object)
+    if len(sample) > sample_size:
+        sample = sample.sample(sample_size, random_state=0)
+    text = sample.map(str).str.strip()
+    candidates = list(candidates)
+    matches = {fmt: pd.to_datetime(text, format=fmt, errors='coerce').notna().to_numpy() for fmt in candidates}
+    remaining = np.ones(len(text), dtype=bool)
+    inferred = []
+    while remaining.any() and candidates:
+        best = max(candidates, key=lambda fmt: (matches[fmt] & remaining).sum())
+        if not (matches[best] & remaining).any():
+            break
+        inferred.append(best)
+        candidates.remove(best)
+        remaining &= ~matches[best]
+    return inferred
+
 
 class DateFormat(object):
+    _format_cache = {}  # (列名, 候选格式) -> 推断出的日期格式,同一数据源重复加载时跳过推断
+
     def __init__(self, interval_day,timeclass='date'):
         self.interval_day = interval_day
         self.timeclass=timeclass #1日期 2时间戳 3时刻
+        self.unparsed = {}  # 列名 -> 无法解析的值
 
     def get_timeparameter(self,Format='%Y%m%d'):
         if self.timeclass=='date':
@@ -47,38 +195,68 @@ class DateFormat(object):
             raise TypeError("你输入的参数不合理!")
         return realtime
 
-    def datetime_standar(self,df, colname, type=""):
-        for index, row in df.iterrows():
-            date_value = row[colname]
-
-            # 检查日期值是否为None
-            if date_value:
-                # 在这里可以对非空日期值进行操作，比如转换日期格式等
-                df.at[index, colname] = pd.to_datetime(date_value, format='mixed')
-            else:
-                # 对空日期值进行处理，可以跳过或执行其他操作
-                pass
+    def datetime_standar(self,df, colname, type="", formats=DATETIME_FORMATS):
+        """
+        向量化标准化日期列:每个不同的值只解析一次,按 formats 优先级依次解析剩余部分,最后用 pandas 推断兜底。
+        None/NaN/空字符串保持不变;无法解析的值保持原样,并记录在 self.unparsed[colname]
+        """
+        series = df[colname]
+        present = _present_mask(series)
+        parsed, unparsed = _parse_unique(pd.unique(series[present]), formats)
+
+        self.unparsed[colname] = unparsed
+        if unparsed:
+            print(f"{colname} 列有 {len(unparsed)} 个值无法解析为日期: {unparsed[:10]}")
+
+        # 缺失值和无法解析的值映射为空,再用原值回填;全部解析成功时保持 datetime64 类型
+        df[colname] = series.map(parsed).where(lambda mapped: mapped.notna(), series)
         return df
 
-    def datetime_standar_lost(self,df, colname):
-    #处理表格的列文本时间格式
-        if self.timeclass == 'date':
-            df[colname] = pd.to_datetime(df[colname]).dt.date
-        elif self.timeclass == 'time':
-            formats = ['%Y-%m-%d', '%H:%M:%S', '%Y-%m-%d %H:%M:%S']
-            for fmt in formats:
-                try:
-                    df[colname] = pd.to_datetime(df[colname], format=fmt)
-                    break
-                except ValueError:
-                    continue
-            else:
-                print(f"Column {colname} cannot be parsed with the provided formats.")
-        else:
+    def datetime_standar_lost(self,df, colname, formats=DATETIME_FORMATS + ('%H:%M:%S',), sample_size=1000):
+        """
+        处理表格的列文本时间格式:抽样推断列中的格式(按列名和候选格式缓存),再按格式分组向量化解析,支持一列混用多种格式。
+        缓存的格式解析不了的新值会在剩余部分上重新推断并补充到缓存,之后的剩余部分交给 pandas 推断(ISO8601、mixed);
+        仍无法解析的值置为 NaT,记录在 self.unparsed[colname]
+        :param formats: 候选格式
+        :param sample_size: 推断格式时的抽样个数
+        """
+        if self.timeclass not in ('date', 'time'):
             print("Invalid type. Choose either 'date' or 'time'.")
+            return df
+
+        series = df[colname]
+        uniques = pd.unique(series[_present_mask(series)])
+        cache_key = (colname, tuple(formats))
+        known = self._format_cache.get(cache_key)
+        if known is None:
+            known = _infer_formats(uniques, formats, sample_size)
+        parsed, unparsed = _parse_unique(uniques, known, fallback=False)
+        if unparsed:
+            extra = _infer_formats(unparsed, [fmt for fmt in formats if fmt not in known], sample_size)
+            known = known + extra
+            more, unparsed = _parse_unique(unparsed, extra, fallback=True)
+            parsed.update(more)
+        DateFormat._format_cache[cache_key] = known
+
+        self.unparsed[colname] = unparsed
+        if unparsed:
+            print(f"Column {colname} has {len(unparsed)} values that cannot be parsed with the provided formats: {unparsed[:10]}")
+
+        result = pd.to_datetime(series.map(parsed))
+        df[colname] = result.dt.date if self.timeclass == 'date' else result
         return df
 
 
+_SQL_ESCAPES = str.maketrans({
+    '\\': '\\\\', "'": "\\'", '"': '\\"', '\0': '\\0', '\n': '\\n', '\r': '\\r', '\x1a': '\\Z',
+})
+
+
+def escape_sql_literal(value):
+    """按 MySQL 字符串字面量规则转义"""
+    return str(value).translate(_SQL_ESCAPES)
+
+
 def decrypt(bs):
     try:
         decoded_bytes = base64.b64decode(bs)
@@ -97,13 +275,12 @@ class eFormat(object):
         self.results = results
 
     def toTuple(self):
+        """取每行第一列拼成 (binary('a'),binary('b'),...),值已转义;键很多时建议用 MySQLDatabase.fetch_in 参数化分批查询"""
         try:
-            results_sql = "(binary('".encode('utf-8')
-            for i in range(len(self.results) - 1):
-                results_sql = results_sql + (str(self.results[i][0]) + "'),binary('").encode("utf-8")
-            results = results_sql + (str(self.results[len(self.results) - 1][0]) + "'))").encode('utf-8')
-            return results
+            if not self.results:
+                raise ValueError("results 为空")
+            literals = ",".join(f"binary('{escape_sql_literal(row[0])}')" for row in self.results)
+            return f"({literals})".encode('utf-8')
         except Exception as e:
             print(e)
             pass
-
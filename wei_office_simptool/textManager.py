@@ -27,61 +27,92 @@
 @email:thisluckyboy@126.com
 """
 import json
+import os
 import re
 
+# 预编译的正则,所有实例共用
+_SUPERSCRIPT_RE = re.compile(r'\*\*|\u00B9|\u00B2|\u00B3|\u2074|\u2075|\u2076|\u2077|\u2078|\u2079')
+_NUMBER_PREFIX_RE = re.compile(r'^(\s|\w|·)?((?<!\d)([0-9]{1,3})((?!\d)|(?![\u4e00-\u9fff]))|(?<![\u4e00-\u9fff])(一|二|三|四|五|六|七|八|九|十|十一|十二|十三|十四|十五|十六|十七|十七|十八|十九|二十|二十一|二十二|二十三|二十四|二十五|二十六|二十七|二十八|二十九|三十|三十一|三十二|三十三|三十四|三十五|三十六|三十七|三十八|三十九|四十|四十一|四十二|四十三|四十四|四十五|四十六|四十七|四十八|四十九|五十|五十一|五十二|五十三|五十四|五十五|五十六|五十七|五十八|五十九|六十|六十一|六十二|六十三|六十四|六十五|六十六|六十七|六十八|六十九|七十|七十一|七十二|七十三|七十四|七十五|七十六|七十七|七十八|七十九|八十|八十一|八十二|八十三|八十四|八十五|八十六|八十七|八十八|八十九|九十|九十一|九十二|九十三|九十四|九十五|九十六|九十七|九十八|九十九)(?![\u4e00-\u9fff]))(、|,|\.|，|\．|:|：){0,5}')
+_BLANK_LINES_RE = re.compile(r'\n+')
+_LINE_NUMBER_RE = re.compile(r'^(\d+)(\、|\.|\ 、|\；)?', flags=re.MULTILINE)
+_FIRST_NUMBER_RE = re.compile(r'^\d+(\、|\.|\ 、)？(\s?)')
+_ZERO_WIDTH_RE = re.compile(r'\u200B')
+
+
+class SeparatorConfig:
+    """分隔符配置(character.json 中的 separator):读取后缓存,文件修改时间变化时自动重新加载"""
+
+    def __init__(self, path='./character.json'):
+        self.path = path
+        self._mtime = None
+        self._separators = None
+
+    def separators(self):
+        """返回分隔符 frozenset;文件不存在或格式不对时返回 None"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            self._mtime = self._separators = None
+            return None
+        if mtime != self._mtime:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as file:
+                    self._separators = frozenset(json.load(file)['separator'])
+            except Exception:
+                self._separators = None
+            self._mtime = mtime
+        return self._separators
+
+
 class textCombing:
-    def __init__(self,global_var1="重排",global_var2=False):
+    def __init__(self,global_var1="重排",global_var2=False,config_path='./character.json'):
         self.global_var1 = global_var1
         self.global_var2 = global_var2
+        self.config = SeparatorConfig(config_path)
 
     def starts_with_symbol_and_number(self,line):
         line = line.replace("\r", "")
         if self.global_var2:
-            line = re.sub(r'\*\*|\u00B9|\u00B2|\u00B3|\u2074|\u2075|\u2076|\u2077|\u2078|\u2079', '', line)
+            line = _SUPERSCRIPT_RE.sub('', line)
         if self.global_var1 == "原版":
             return (0, line)
         else:
-            pattern = r'^(\s|\w|·)?((?<!\d)([0-9]{1,3})((?!\d)|(?![\u4e00-\u9fff]))|(?<![\u4e00-\u9fff])(一|二|三|四|五|六|七|八|九|十|十一|十二|十三|十四|十五|十六|十七|十七|十八|十九|二十|二十一|二十二|二十三|二十四|二十五|二十六|二十七|二十八|二十九|三十|三十一|三十二|三十三|三十四|三十五|三十六|三十七|三十八|三十九|四十|四十一|四十二|四十三|四十四|四十五|四十六|四十七|四十八|四十九|五十|五十一|五十二|五十三|五十四|五十五|五十六|五十七|五十八|五十九|六十|六十一|六十二|六十三|六十四|六十五|六十六|六十七|六十八|六十九|七十|七十一|七十二|七十三|七十四|七十五|七十六|七十七|七十八|七十九|八十|八十一|八十二|八十三|八十四|八十五|八十六|八十七|八十八|八十九|九十|九十一|九十二|九十三|九十四|九十五|九十六|九十七|九十八|九十九)(?![\u4e00-\u9fff]))(、|,|\.|，|\．|:|：){0,5}'
-            match = re.match(pattern, line)
+            match = _NUMBER_PREFIX_RE.match(line)
             if match:
-                line = re.sub(pattern, r'NUM', line)
+                # 模式以 ^ 锚定且不是多行模式,只会替换开头这一处
+                line = 'NUM' + line[match.end():]
                 return (match.group(2), line)
             else:
                 return (0, line)
 
     def process_text(self,text):
-        processed_text = re.sub(r'\n+', '\n', text)
-        processed_text = re.sub(r'^(\d+)(\、|\.|\ 、|\；)?', r'\1、', processed_text, flags=re.MULTILINE)
-        processed_text = re.sub(r'^\d+(\、|\.|\ 、)？(\s?)', r'1 \2', processed_text)
-        processed_text = re.sub(r'\u200B', '', processed_text)
+        processed_text = _BLANK_LINES_RE.sub('\n', text)
+        processed_text = _LINE_NUMBER_RE.sub(r'\1、', processed_text)
+        processed_text = _FIRST_NUMBER_RE.sub(r'1 \2', processed_text)
+        processed_text = _ZERO_WIDTH_RE.sub('', processed_text)
 
-        adjusted_text = ""
+        # 配置每次调用只检查一次(按修改时间缓存),不再逐行打开文件
+        separators = self.config.separators()
+        buffer = []
         adjusted_num = 0
         for line in processed_text.splitlines():
-            if line.strip() != "":
-                if line.strip()[0].isdigit():
-                    adjusted_text += "\n"
+            stripped = line.strip()
+            if stripped != "":
+                if stripped[0].isdigit():
+                    buffer.append("\n")
                     adjusted_num = 0
-                else:
-                    if adjusted_num == -1 and not line.strip()[0].isdigit():
-                        adjusted_text += '1、'
+                elif adjusted_num == -1:
+                    buffer.append('1、')
                 adjusted_num += len(line)
-                adjusted_text += line
-                try:
-                    # 读取配置文件
-                    with open('./character.json', 'r', encoding='utf-8') as file:
-                        data = json.load(file)
-                        if adjusted_text and (
-                                not (adjusted_text[-1] in data['separator']) and not (
-                                line[0] in data['separator'])):
-                            adjusted_text += "，"
-                except:
-                    pass
+                buffer.append(line)
+                # 刚追加的 line 非空,所以已拼接文本的最后一个字符就是 line[-1]
+                if separators is not None and line[-1] not in separators and line[0] not in separators:
+                    buffer.append("，")
                 if adjusted_num >= 200:
                     adjusted_num = -1
-                    adjusted_text = adjusted_text[:-1] + "。"
-                    adjusted_text += "\n"
-        adjusted_text = adjusted_text.strip()[:-1] + "。"
+                    buffer[-1] = buffer[-1][:-1] + "。"
+                    buffer.append("\n")
+        adjusted_text = "".join(buffer).strip()[:-1] + "。"
         return adjusted_text.strip()
 
     def remove_leading_spaces(self,text):
@@ -94,24 +125,28 @@ class textCombing:
         return cleaned_text
 
     def format_text(self,text):
-        list_char = []
+        seen = set()
         lines = [line for line in text.strip().split('\n') if line.strip() != '']
         counter_character = 1
-        output_text = ""
+        output = []
 
         for line in lines:
             patnum, line = self.starts_with_symbol_and_number(line)
-            if line in list_char:
+            if line in seen:
                 continue
-            list_char.append(line)
+            seen.add(line)
             if line.startswith('NUM'):
                 if self.global_var1 == "不重排" and (patnum == "1" or patnum == 1 or patnum == "一"):
                     counter_character = 1
-                output_text += f"{str(counter_character)}、{self.remove_leading_spaces(line.strip()[3:])}\n"
+                output.append(f"{str(counter_character)}、{self.remove_leading_spaces(line.strip()[3:])}\n")
                 counter_character += 1
             elif line.startswith('SSS'):
-                output_text += f"{self.remove_leading_spaces(line[3:].strip())}\n"
+                output.append(f"{self.remove_leading_spaces(line[3:].strip())}\n")
             else:
-                output_text += line + '\n'
+                output.append(line + '\n')
                 # 最后的空行
-        return output_text.strip()
\ No newline at end of file
+        return ''.join(output).strip()
+
+    def format_texts(self,texts):
+        """批量格式化多篇文本,共用预编译的正则,返回结果列表"""
+        return [self.format_text(text) for text in texts]